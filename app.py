@@ -1,21 +1,41 @@
 import streamlit as st
+from functools import lru_cache
+from dotenv import load_dotenv
 st.set_page_config(
         page_title="LoveReel",
         page_icon="🎬",
         menu_items=None
     )
+
+
+@st.cache_resource
+def _load_env() -> bool:
+    """Read .env once per process, before the modules below read their settings"""
+    return load_dotenv()
+
+
+_load_env()
 from flows import creator, recipient
-from utils.helpers import cleanup_temp_files
+from utils.assets import asset_store
+from core.metrics import start_metrics_server
+from core.warmup import start_warmup
 from flows.creator import creator_flow
 from flows.recipient import recipient_flow
-import threading
 
 
-def inject_css():
+@lru_cache(maxsize=1)
+def _load_css() -> str:
+    """Read the stylesheet once per process"""
     with open("static/css/style.css") as f:
-        st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+        return f"<style>{f.read()}</style>"
+
+def inject_css():
+    st.markdown(_load_css(), unsafe_allow_html=True)
 
 def main():
+    start_metrics_server()
+    start_warmup()
+    asset_store.start_janitor()
     inject_css()
     query_params = st.query_params.to_dict()
     
@@ -24,10 +44,6 @@ def main():
     else:
         creator_flow()
         
-    cleanup_thread = threading.Thread(target=cleanup_temp_files)
-    cleanup_thread.daemon = True 
-    cleanup_thread.start()
-        
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,193 @@
+"""Headless bulk story generation.
+
+Reads StoryCreate records from a JSONL file, generates content on a bounded
+pool of workers, saves stories to Mongo with batched insert_many and prints a
+shareable link per story. Progress is appended to a state file so an
+interrupted or partially failed run can be resumed by running it again:
+
+    python batch_generate.py campaign.jsonl --workers 8 --links links.jsonl
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, TextIO, Tuple
+from pydantic import ValidationError
+from dotenv import load_dotenv
+
+# Before the project imports below, which read their settings at import time.
+load_dotenv()
+
+from core.ai_client import DeepSeekClient
+from core.database import Database, ensure_indexes
+from core.idempotency import payload_key
+from core.prompts import build_story_prompt
+from models.schemas import StoryCreate, GeneratedContent
+from utils.helpers import format_shareable_link
+
+DONE_STATUSES = ("saved", "invalid")
+
+
+def load_state(path: str) -> Dict[str, dict]:
+    """Latest state entry per record key"""
+    state: Dict[str, dict] = {}
+    if not os.path.exists(path):
+        return state
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            state[entry["key"]] = entry
+    return state
+
+
+def read_records(path: str) -> List[Tuple[int, str, Optional[StoryCreate], Optional[str]]]:
+    """(line number, key, parsed story or None, validation error or None) per record"""
+    records = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                story = StoryCreate(**json.loads(line))
+                records.append((line_no, payload_key(story, "batch"), story, None))
+            except (json.JSONDecodeError, ValidationError, TypeError) as e:
+                records.append((line_no, f"invalid-line-{line_no}", None, str(e)))
+    return records
+
+
+class BatchRunner:
+    def __init__(self, state_file: TextIO, links_file: TextIO, batch_size: int, expires_in: Optional[float] = None):
+        self.state_file = state_file
+        self.links_file = links_file
+        self.batch_size = batch_size
+        self.expires_in = expires_in
+        self.db = Database()
+        self.pending: List[Tuple[int, str, StoryCreate, GeneratedContent]] = []
+        self.counts = {"saved": 0, "failed": 0, "invalid": 0, "skipped": 0}
+        self.latencies: List[float] = []
+
+    def record(self, entry: dict) -> None:
+        self.state_file.write(json.dumps(entry) + "\n")
+        self.state_file.flush()
+        self.counts[entry["status"]] += 1
+
+    def add(self, line_no: int, key: str, story: StoryCreate, content: GeneratedContent) -> None:
+        self.pending.append((line_no, key, story, content))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            story_ids = self.db.save_stories(
+                [(story, content) for _, _, story, content in batch],
+                expires_in=self.expires_in
+            )
+        except Exception as e:
+            logging.error(f"Batch insert failed: {str(e)}")
+            story_ids = [None] * len(batch)
+
+        for (line_no, key, _, _), story_id in zip(batch, story_ids):
+            if story_id is None:
+                self.record({"line": line_no, "key": key, "status": "failed", "error": "insert failed"})
+                continue
+            link = format_shareable_link(story_id)
+            self.record({"line": line_no, "key": key, "status": "saved", "story_id": story_id, "link": link})
+            self.links_file.write(json.dumps({"line": line_no, "story_id": story_id, "link": link}) + "\n")
+        self.links_file.flush()
+
+
+def _generate(client: DeepSeekClient, story: StoryCreate) -> Tuple[GeneratedContent, float]:
+    start = time.perf_counter()
+    content = client.generate_story_content(build_story_prompt(story))
+    return content, time.perf_counter() - start
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file of StoryCreate records")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent generations")
+    parser.add_argument("--batch-size", type=int, default=25, help="stories per insert_many")
+    parser.add_argument("--state", help="resume state file (default: <input>.state.jsonl)")
+    parser.add_argument("--links", help="write link records here (default: stdout)")
+    parser.add_argument("--limit", type=int, help="process at most this many pending records")
+    parser.add_argument("--expire-days", type=float,
+                        help="delete the stories this many days after saving (default: STORY_TTL_DAYS)")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    state_path = args.state or f"{args.input}.state.jsonl"
+    state = load_state(state_path)
+    records = read_records(args.input)
+
+    links_file = open(args.links, "a") if args.links else sys.stdout
+    state_file = open(state_path, "a")
+    expires_in = args.expire_days * 86400 if args.expire_days is not None else None
+    runner = BatchRunner(state_file, links_file, args.batch_size, expires_in)
+    start = time.perf_counter()
+
+    todo = []
+    seen = set()
+    for line_no, key, story, error in records:
+        if state.get(key, {}).get("status") in DONE_STATUSES or key in seen:
+            runner.counts["skipped"] += 1
+        elif story is None:
+            runner.record({"line": line_no, "key": key, "status": "invalid", "error": error})
+        else:
+            seen.add(key)
+            todo.append((line_no, key, story))
+    if args.limit is not None:
+        todo = todo[:args.limit]
+
+    ensure_indexes(runner.db.client)
+    client = DeepSeekClient()
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="batch") as pool:
+            futures = {pool.submit(_generate, client, story): (line_no, key, story) for line_no, key, story in todo}
+            for future in as_completed(futures):
+                line_no, key, story = futures[future]
+                try:
+                    content, elapsed = future.result()
+                except Exception as e:
+                    runner.record({"line": line_no, "key": key, "status": "failed", "error": str(e)})
+                    continue
+                runner.latencies.append(elapsed)
+                runner.add(line_no, key, story, content)
+    finally:
+        runner.flush()
+        state_file.close()
+        if links_file is not sys.stdout:
+            links_file.close()
+
+    elapsed = time.perf_counter() - start
+    report = {
+        **runner.counts,
+        "elapsed_s": round(elapsed, 2),
+        "stories_per_s": round(runner.counts["saved"] / elapsed, 3) if elapsed else 0.0,
+    }
+    if runner.latencies:
+        report["generate_p50_s"] = round(_percentile(runner.latencies, 50), 2)
+        report["generate_p95_s"] = round(_percentile(runner.latencies, 95), 2)
+    print(json.dumps(report), file=sys.stderr)
+    return 1 if runner.counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,337 @@
+"""In-process stand-in for the slice of the pymongo API this app uses.
+
+Documents live in memory and every operation can be given a fixed latency to
+approximate a network round trip. Only the query and update operators the
+app actually issues are supported.
+"""
+import asyncio
+import copy
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+
+_MISSING = object()
+
+
+def _get_path(doc: dict, path: str) -> Any:
+    value: Any = doc
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+
+def _set_path(doc: dict, path: str, value: Any) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc: dict, path: str) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part, {})
+    doc.pop(parts[-1], None)
+
+
+def _matches_condition(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        for op, arg in condition.items():
+            if op == "$in" and value not in arg:
+                return False
+            if op == "$nin" and value in arg:
+                return False
+            if op == "$ne" and value == arg:
+                return False
+            if op == "$exists" and (value is not _MISSING) != bool(arg):
+                return False
+            if op in ("$lt", "$lte", "$gt", "$gte"):
+                if value is _MISSING or value is None:
+                    return False
+                if op == "$lt" and not value < arg:
+                    return False
+                if op == "$lte" and not value <= arg:
+                    return False
+                if op == "$gt" and not value > arg:
+                    return False
+                if op == "$gte" and not value >= arg:
+                    return False
+        return True
+    return value == condition
+
+
+def _matches(doc: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(_matches(doc, sub) for sub in condition):
+                return False
+            continue
+        if not _matches_condition(_get_path(doc, key), condition):
+            return False
+    return True
+
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    included = [k for k, v in projection.items() if v and k != "_id"]
+    if included:
+        result = {}
+        for key in included:
+            value = _get_path(doc, key)
+            if value is not _MISSING:
+                _set_path(result, key, copy.deepcopy(value))
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    result = copy.deepcopy(doc)
+    for key, value in projection.items():
+        if not value:
+            _unset_path(result, key)
+    return result
+
+
+def _apply_update(doc: dict, update: dict, inserting: bool) -> None:
+    for op, fields in update.items():
+        if op == "$set" or (op == "$setOnInsert" and inserting):
+            for key, value in fields.items():
+                _set_path(doc, key, copy.deepcopy(value))
+        elif op == "$inc":
+            for key, value in fields.items():
+                current = _get_path(doc, key)
+                _set_path(doc, key, (0 if current is _MISSING else current) + value)
+        elif op == "$push":
+            for key, value in fields.items():
+                current = _get_path(doc, key)
+                _set_path(doc, key, ([] if current is _MISSING else current) + [copy.deepcopy(value)])
+        elif op == "$unset":
+            for key in fields:
+                _unset_path(doc, key)
+
+
+class FakeCursor:
+    def __init__(self, docs: List[dict]):
+        self._docs = docs
+
+    def sort(self, key, direction: int = 1) -> "FakeCursor":
+        if isinstance(key, list):
+            for field, order in reversed(key):
+                self._docs.sort(key=lambda d: _get_path(d, field), reverse=order < 0)
+        else:
+            self._docs.sort(key=lambda d: _get_path(d, key), reverse=direction < 0)
+        return self
+
+    def limit(self, count: int) -> "FakeCursor":
+        if count:
+            self._docs = self._docs[:count]
+        return self
+
+    def __iter__(self):
+        return iter(self._docs)
+
+
+class FakeCollection:
+    def __init__(self, name: str, latency: float):
+        self.name = name
+        self.latency = latency
+        self.indexes: Dict[str, dict] = {}
+        self._docs: Dict[Any, dict] = {}
+        self._lock = threading.RLock()
+
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def insert_one(self, doc: dict):
+        self._wait()
+        with self._lock:
+            doc.setdefault("_id", ObjectId())
+            self._docs[doc["_id"]] = copy.deepcopy(doc)
+        return SimpleNamespace(inserted_id=doc["_id"], acknowledged=True)
+
+    def insert_many(self, docs: Iterable[dict], ordered: bool = True):
+        self._wait()
+        ids = []
+        errors = []
+        with self._lock:
+            for index, doc in enumerate(docs):
+                doc.setdefault("_id", ObjectId())
+                if doc["_id"] in self._docs:
+                    errors.append({"index": index, "code": 11000, "errmsg": "duplicate key"})
+                    if ordered:
+                        break
+                    continue
+                self._docs[doc["_id"]] = copy.deepcopy(doc)
+                ids.append(doc["_id"])
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(ids)})
+        return SimpleNamespace(inserted_ids=ids, acknowledged=True)
+
+    def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None):
+        self._wait()
+        with self._lock:
+            for doc in self._docs.values():
+                if _matches(doc, query):
+                    return _project(doc, projection)
+        return None
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None):
+        self._wait()
+        with self._lock:
+            return FakeCursor([_project(d, projection) for d in self._docs.values() if _matches(d, query)])
+
+    def count_documents(self, query: dict) -> int:
+        self._wait()
+        with self._lock:
+            return sum(1 for d in self._docs.values() if _matches(d, query))
+
+    def _update(self, query: dict, update: dict, upsert: bool, many: bool):
+        matched = 0
+        upserted_id = None
+        with self._lock:
+            for doc in self._docs.values():
+                if _matches(doc, query):
+                    _apply_update(doc, update, inserting=False)
+                    matched += 1
+                    if not many:
+                        break
+            if not matched and upsert:
+                doc = {k: copy.deepcopy(v) for k, v in query.items() if not k.startswith("$")}
+                _apply_update(doc, update, inserting=True)
+                doc.setdefault("_id", ObjectId())
+                self._docs[doc["_id"]] = doc
+                upserted_id = doc["_id"]
+        return SimpleNamespace(matched_count=matched, modified_count=matched, upserted_id=upserted_id)
+
+    def update_one(self, query: dict, update: dict, upsert: bool = False):
+        self._wait()
+        return self._update(query, update, upsert, many=False)
+
+    def update_many(self, query: dict, update: dict, upsert: bool = False):
+        self._wait()
+        return self._update(query, update, upsert, many=True)
+
+    def find_one_and_update(self, query: dict, update: dict, projection: Optional[dict] = None,
+                            upsert: bool = False, return_document: bool = False):
+        self._wait()
+        with self._lock:
+            before = next((d for d in self._docs.values() if _matches(d, query)), None)
+            snapshot = copy.deepcopy(before) if before else None
+            result = self._update(query, update, upsert, many=False)
+            if return_document:
+                target = before if before is not None else self._docs.get(result.upserted_id)
+                return _project(target, projection) if target else None
+            return _project(snapshot, projection) if snapshot else None
+
+    def delete_one(self, query: dict):
+        self._wait()
+        with self._lock:
+            for key, doc in list(self._docs.items()):
+                if _matches(doc, query):
+                    del self._docs[key]
+                    return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    def delete_many(self, query: dict):
+        self._wait()
+        with self._lock:
+            keys = [k for k, d in self._docs.items() if _matches(d, query)]
+            for key in keys:
+                del self._docs[key]
+        return SimpleNamespace(deleted_count=len(keys))
+
+    def bulk_write(self, requests: list, ordered: bool = True):
+        self._wait()
+        for request in requests:
+            doc = request._doc
+            if type(request).__name__ == "InsertOne":
+                with self._lock:
+                    doc.setdefault("_id", ObjectId())
+                    self._docs[doc["_id"]] = copy.deepcopy(doc)
+            elif type(request).__name__ in ("UpdateOne", "UpdateMany"):
+                self._update(request._filter, doc, bool(request._upsert),
+                             many=type(request).__name__ == "UpdateMany")
+        return SimpleNamespace(acknowledged=True)
+
+    def create_index(self, keys, **kwargs) -> str:
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        name = kwargs.get("name") or "_".join(f"{k}_{v}" for k, v in keys)
+        self.indexes[name] = {"key": keys, **kwargs}
+        return name
+
+    def create_indexes(self, models: list) -> List[str]:
+        return [self.create_index(m.document["key"].items(), **{
+            k: v for k, v in m.document.items() if k != "key"
+        }) for m in models]
+
+
+class FakeDatabase:
+    def __init__(self, name: str, latency: float):
+        self.name = name
+        self.latency = latency
+        self._collections: Dict[str, FakeCollection] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = FakeCollection(name, self.latency)
+            return self._collections[name]
+
+    def command(self, name: str, *args, **kwargs) -> dict:
+        return {"ok": 1.0}
+
+
+class FakeMongoClient:
+    """Drop-in for pymongo.MongoClient: client[db][collection]"""
+
+    def __init__(self, latency: float = 0.002):
+        self.latency = latency
+        self._databases: Dict[str, FakeDatabase] = {}
+        self._lock = threading.Lock()
+        self.admin = FakeDatabase("admin", 0.0)
+
+    def __getitem__(self, name: str) -> FakeDatabase:
+        with self._lock:
+            if name not in self._databases:
+                self._databases[name] = FakeDatabase(name, self.latency)
+            return self._databases[name]
+
+    def close(self) -> None:
+        pass
+
+
+class _AsyncProxy:
+    """Awaitable view of a fake database or collection; calls run in a worker thread"""
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getitem__(self, name: str) -> "_AsyncProxy":
+        return _AsyncProxy(self._target[name])
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(attr, *args, **kwargs)
+        return call
+
+
+class FakeAsyncMongoClient(_AsyncProxy):
+    """Drop-in for pymongo.AsyncMongoClient sharing a FakeMongoClient's data"""
+
+    def __init__(self, client: FakeMongoClient):
+        super().__init__(client)
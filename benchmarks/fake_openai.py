@@ -0,0 +1,239 @@
+"""Local OpenAI-compatible HTTP server for offline benchmarks.
+
+Serves /v1/chat/completions (plain and streamed), /v1/images/generations
+(url or b64_json) and the image URLs it hands out, each with configurable
+latency. Completions are always valid GeneratedContent JSON.
+"""
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image
+
+
+def make_story(scene_count: int = 5) -> dict:
+    """Schema-valid GeneratedContent payload"""
+    return {
+        "title": "Love, Actually Debugged",
+        "scenes": [
+            {
+                "scene_number": i + 1,
+                "content": f"Scene {i + 1}: the couple trades knowing glances across a crowded café. " * 6,
+                "quiz": {
+                    "question": f"What happened in scene {i + 1}?",
+                    "options": ["They laughed", "They danced", "They got lost"],
+                    "correct_index": i % 3,
+                },
+                "commentary": "Pure rom-com gold, folks.",
+            }
+            for i in range(scene_count)
+        ],
+        "bloopers": [f"Blooper {i + 1}: someone tripped over the boom mic." for i in range(scene_count)],
+    }
+
+
+def make_png(size: str = "1792x1024") -> bytes:
+    width, height = (int(v) for v in size.split("x"))
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), color=(230, 180, 190)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeOpenAIServer:
+    """Threaded fake API; latencies are in seconds with uniform +/- jitter"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        chat_latency: float = 0.5,
+        image_latency: float = 1.0,
+        download_latency: float = 0.05,
+        jitter: float = 0.2,
+        chunk_size: int = 64,
+    ):
+        self.chat_latency = chat_latency
+        self.image_latency = image_latency
+        self.download_latency = download_latency
+        self.jitter = jitter
+        self.chunk_size = chunk_size
+        self.png = make_png()
+        self.requests = {"chat": 0, "images": 0, "downloads": 0}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _sleep(self, latency: float) -> None:
+        if latency > 0:
+            time.sleep(max(0.0, latency * random.uniform(1 - self.jitter, 1 + self.jitter)))
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.requests[kind] += 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload: dict, status: int = 200):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _read_json(self) -> dict:
+                length = int(self.headers.get("Content-Length", "0"))
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_POST(self):
+                request = self._read_json()
+                if self.path.endswith("/chat/completions"):
+                    server._count("chat")
+                    self._chat(request)
+                elif self.path.endswith("/images/generations"):
+                    server._count("images")
+                    self._image(request)
+                else:
+                    self._send_json({"error": {"message": "not found"}}, 404)
+
+            def do_GET(self):
+                if self.path.startswith("/images/"):
+                    server._count("downloads")
+                    server._sleep(server.download_latency)
+                    self.send_response(200)
+                    self.send_header("Content-Type", "image/png")
+                    self.send_header("Content-Length", str(len(server.png)))
+                    self.end_headers()
+                    self.wfile.write(server.png)
+                else:
+                    self._send_json({"error": {"message": "not found"}}, 404)
+
+            def _chat(self, request: dict):
+                content = json.dumps(make_story())
+                usage = {
+                    "prompt_tokens": 900,
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": 900 + len(content) // 4,
+                    "prompt_tokens_details": {"cached_tokens": 0},
+                }
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                model = request.get("model", "gpt-4o-mini")
+
+                if not request.get("stream"):
+                    server._sleep(server.chat_latency)
+                    self._send_json({
+                        "id": completion_id,
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }],
+                        "usage": usage,
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                pieces = [content[i:i + server.chunk_size] for i in range(0, len(content), server.chunk_size)]
+                per_piece = server.chat_latency / max(1, len(pieces))
+                for piece in pieces:
+                    server._sleep(per_piece)
+                    self._send_event({
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                    })
+                self._send_event({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                })
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    self._send_event({
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [],
+                        "usage": usage,
+                    })
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def _send_event(self, payload: dict):
+                self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def _image(self, request: dict):
+                server._sleep(server.image_latency)
+                if request.get("response_format") == "b64_json":
+                    item = {"b64_json": base64.b64encode(server.png).decode("ascii")}
+                else:
+                    item = {"url": f"{server.base_url}/images/{uuid.uuid4().hex}.png"}
+                self._send_json({"created": int(time.time()), "data": [item]})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--chat-latency", type=float, default=0.5)
+    parser.add_argument("--image-latency", type=float, default=1.0)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        port=args.port,
+        chat_latency=args.chat_latency,
+        image_latency=args.image_latency,
+        jitter=args.jitter,
+    )
+    print(f"Fake OpenAI listening on {server.base_url}/v1")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
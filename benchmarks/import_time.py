@@ -0,0 +1,99 @@
+"""Cold-start import benchmark.
+
+Imports each entry module in a fresh interpreter, as a new pod would, and
+reports p50/p95/p99 import time. It also fails if a page module loads a
+dependency that should only load when it is used (openai, PIL and numpy for
+the recipient page, for instance):
+
+    python benchmarks/import_time.py --iterations 10 --output imports.json
+    python benchmarks/import_time.py --baseline imports.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.run import compare, summarize
+
+# Module -> dependencies it must not load at import time.
+TARGETS: Dict[str, tuple] = {
+    "flows.recipient": ("openai", "PIL", "numpy", "requests"),
+    "flows.creator": ("openai", "PIL", "numpy", "requests"),
+    "core.warmup": ("openai", "PIL", "numpy", "requests"),
+    "app": ("openai", "PIL", "numpy", "requests"),
+}
+
+_PROBE = """
+import sys, time, json, importlib
+start = time.perf_counter()
+importlib.import_module({module!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str, lazy: tuple) -> dict:
+    """Import one module in a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, lazy=lazy)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p95 increase")
+    parser.add_argument("--min-delta-ms", type=float, default=20.0, help="ignore regressions smaller than this")
+    args = parser.parse_args()
+
+    samples: Dict[str, List[float]] = {}
+    eager: Dict[str, List[str]] = {}
+    for _ in range(args.iterations):
+        for module, lazy in TARGETS.items():
+            probe = measure(module, lazy)
+            samples.setdefault(f"import.{module}", []).append(probe["seconds"])
+            if probe["loaded"]:
+                eager[module] = probe["loaded"]
+
+    report = {
+        "config": vars(args),
+        "metrics": {name: summarize(values) for name, values in sorted(samples.items())},
+        "eager_imports": eager,
+    }
+
+    width = max(len(n) for n in report["metrics"])
+    print(f"{'metric':<{width}}  {'n':>4}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}")
+    for name, stats in report["metrics"].items():
+        print(f"{name:<{width}}  {stats['count']:>4}  {stats['p50_ms']:>9.1f}  {stats['p95_ms']:>9.1f}  {stats['p99_ms']:>9.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    exit_code = 0
+    for module, loaded in eager.items():
+        print(f"EAGER {module} imports {', '.join(loaded)}", file=sys.stderr)
+        exit_code = 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["metrics"]
+        regressions = compare(report["metrics"], baseline, args.tolerance, args.min_delta_ms)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
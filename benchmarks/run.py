@@ -0,0 +1,278 @@
+"""Offline end-to-end benchmark for the creator and recipient flows.
+
+Runs app.py under Streamlit's AppTest against a local fake OpenAI server and
+an in-process Mongo stand-in, then reports p50/p95/p99 latency per stage and
+per flow. Use --output to write JSON and --baseline to fail on regressions:
+
+    python benchmarks/run.py --iterations 20 --output bench.json
+    python benchmarks/run.py --baseline bench.json --tolerance 0.25
+"""
+import argparse
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+class Recorder:
+    """Collects latency samples in seconds, grouped by name"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.samples[name].append(seconds)
+
+    def timed(self, name: str, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+        return wrapper
+
+    def timed_async(self, name: str, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+        return wrapper
+
+    def summary(self) -> Dict[str, dict]:
+        with self._lock:
+            return {name: summarize(values) for name, values in sorted(self.samples.items())}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(round(pct / 100 * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+def summarize(values: List[float]) -> dict:
+    return {
+        "count": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 3),
+        "p50_ms": round(1000 * percentile(values, 50), 3),
+        "p95_ms": round(1000 * percentile(values, 95), 3),
+        "p99_ms": round(1000 * percentile(values, 99), 3),
+    }
+
+
+def instrument(recorder: Recorder) -> None:
+    """Wrap the app's I/O entry points so each call is timed as a stage"""
+    import core.ai_client
+    import core.database
+    import utils.helpers
+    import flows.recipient
+
+    DeepSeekClient = core.ai_client.DeepSeekClient
+    DeepSeekClient.generate_story_content = recorder.timed(
+        "stage.llm_generate", DeepSeekClient.generate_story_content)
+    Database = core.database.Database
+    Database.save_story = recorder.timed("stage.db_save_story", Database.save_story)
+    Database.get_story = recorder.timed("stage.db_get_story", Database.get_story)
+    Database.get_recipient_story = recorder.timed(
+        "stage.story_lookup", Database.get_recipient_story)
+    DeepSeekClient.agenerate_story_content = recorder.timed_async(
+        "stage.llm_generate", DeepSeekClient.agenerate_story_content)
+    AsyncDatabase = core.database.AsyncDatabase
+    AsyncDatabase.save_story = recorder.timed_async("stage.db_save_story", AsyncDatabase.save_story)
+    AsyncDatabase.get_story = recorder.timed_async("stage.db_get_story", AsyncDatabase.get_story)
+    AsyncDatabase.get_recipient_story = recorder.timed_async(
+        "stage.story_lookup", AsyncDatabase.get_recipient_story)
+    poster = recorder.timed("stage.poster_lookup", utils.helpers.generate_temp_poster)
+    utils.helpers.generate_temp_poster = poster
+    flows.recipient.generate_temp_poster = poster
+
+
+def run_creator(recorder: Recorder, timeout: float) -> str:
+    """Drive the creator flow to a saved story and return its id"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=timeout)
+    flow_start = time.perf_counter()
+
+    start = time.perf_counter()
+    at.run()
+    recorder.add("creator.load", time.perf_counter() - start)
+
+    for i in range(3):
+        at.text_input(key=f"memory_title_{i}").set_value(f"Memory {i}")
+        at.text_area(key=f"memory_desc_{i}").set_value(f"We spent a whole afternoon doing thing {i}.")
+    start = time.perf_counter()
+    next(b for b in at.button if b.label == "Next").click().run()
+    recorder.add("creator.memories_step", time.perf_counter() - start)
+
+    for i in range(3):
+        at.text_input(key=f"question_{i}").set_value(f"Favourite thing {i}?")
+        at.text_input(key=f"answer_{i}").set_value(f"Answer {i}")
+    start = time.perf_counter()
+    next(b for b in at.button if b.label == "Generate Story").click().run()
+    recorder.add("creator.generate_step", time.perf_counter() - start)
+    # Generation runs as a background job; poll the page the way the job view does.
+    deadline = time.perf_counter() + timeout
+    while not at.exception and not at.code and time.perf_counter() < deadline:
+        time.sleep(0.05)
+        at.run()
+    recorder.add("creator.job_wait", time.perf_counter() - start)
+    recorder.add("flow.creator", time.perf_counter() - flow_start)
+
+    if at.exception or not at.code:
+        raise RuntimeError(f"Creator flow did not produce a link: {at.exception or at.error}")
+    return at.code[0].value.rsplit("story_id=", 1)[1]
+
+
+def run_recipient(recorder: Recorder, story_id: str, timeout: float) -> None:
+    """Answer every question of a story and view the results"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=timeout)
+    at.query_params["story_id"] = story_id
+    flow_start = time.perf_counter()
+
+    start = time.perf_counter()
+    at.run()
+    recorder.add("recipient.load", time.perf_counter() - start)
+
+    # Answers live in a form, so choosing one does not rerun the script.
+    for radio in list(at.radio):
+        radio.set_value(radio.options[0])
+
+    start = time.perf_counter()
+    next(b for b in at.button if "Submit" in b.label).click().run()
+    recorder.add("recipient.results", time.perf_counter() - start)
+    recorder.add("flow.recipient", time.perf_counter() - flow_start)
+
+    if at.exception or not at.get("image"):
+        raise RuntimeError(f"Recipient flow did not render results: {at.exception or at.error}")
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict], tolerance: float, min_delta_ms: float) -> List[str]:
+    """Return a message for every p95 that regressed beyond the tolerance"""
+    regressions = []
+    for name, stats in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        limit = base["p95_ms"] * (1 + tolerance)
+        if stats["p95_ms"] > limit and stats["p95_ms"] - base["p95_ms"] > min_delta_ms:
+            regressions.append(f"{name}: p95 {stats['p95_ms']:.1f}ms > {limit:.1f}ms (baseline {base['p95_ms']:.1f}ms)")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="seconds per completion")
+    parser.add_argument("--image-latency", type=float, default=0.5, help="seconds per images.generate")
+    parser.add_argument("--mongo-latency", type=float, default=0.002, help="seconds per Mongo operation")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--cold-posters", action="store_true", help="empty the poster cache before each iteration")
+    parser.add_argument("--timeout", type=float, default=60.0, help="AppTest timeout per script run")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p95 increase")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="ignore regressions smaller than this")
+    parser.add_argument("--io-backend", choices=("sync", "async"), default="sync",
+                        help="IO_BACKEND for the app under test")
+    parser.add_argument("--app-metrics", action="store_true", help="enable core.metrics and include its snapshot")
+    args = parser.parse_args()
+
+    from benchmarks.fake_openai import FakeOpenAIServer
+    from benchmarks.fake_mongo import FakeAsyncMongoClient, FakeMongoClient
+
+    server = FakeOpenAIServer(
+        chat_latency=args.chat_latency,
+        image_latency=args.image_latency,
+        jitter=args.jitter,
+    ).start()
+
+    poster_dir = tempfile.mkdtemp(prefix="lovereel_bench_posters_")
+    os.environ.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"{server.base_url}/v1",
+        "DB_NAME": "lovereel_bench",
+        "BASE_URL": "http://bench.local",
+        "POSTER_CACHE_DIR": poster_dir,
+        "IO_BACKEND": args.io_backend,
+    })
+    if args.app_metrics:
+        os.environ["METRICS_ENABLED"] = "true"
+    os.chdir(ROOT)
+
+    import core.database
+    from utils.poster_cache import poster_cache
+
+    import core.aio
+
+    core.database._client = FakeMongoClient(latency=args.mongo_latency)
+    core.aio._async_mongo = FakeAsyncMongoClient(core.database._client)
+    recorder = Recorder()
+    instrument(recorder)
+
+    failures = 0
+    try:
+        for _ in range(args.iterations):
+            if args.cold_posters:
+                poster_cache.clear()
+            try:
+                story_id = run_creator(recorder, args.timeout)
+                run_recipient(recorder, story_id, args.timeout)
+            except Exception as e:
+                failures += 1
+                print(f"iteration failed: {e}", file=sys.stderr)
+    finally:
+        server.stop()
+
+    report = {
+        "config": vars(args),
+        "failures": failures,
+        "requests": dict(server.requests),
+        "metrics": recorder.summary(),
+    }
+    if args.app_metrics:
+        from core.metrics import registry
+        report["app_metrics"] = registry.snapshot()
+
+    width = max((len(n) for n in report["metrics"]), default=10)
+    print(f"{'metric':<{width}}  {'n':>4}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}")
+    for name, stats in report["metrics"].items():
+        print(f"{name:<{width}}  {stats['count']:>4}  {stats['p50_ms']:>9.1f}  {stats['p95_ms']:>9.1f}  {stats['p99_ms']:>9.1f}")
+    print(f"upstream requests: {report['requests']}  failures: {failures}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    exit_code = 1 if failures else 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["metrics"]
+        regressions = compare(report["metrics"], baseline, args.tolerance, args.min_delta_ms)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
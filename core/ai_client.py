@@ -1,152 +1,451 @@
 import os
 import json
-import requests
-from openai import OpenAI
-from openai import APIConnectionError, APIError, RateLimitError
+import threading
+import time
+from openai import APIConnectionError, APIError, RateLimitError, InternalServerError
+from pydantic import ValidationError
 from models.schemas import GeneratedContent
+from core.resilience import AsyncSlots, TokenBucket, DeadlineExceeded, CircuitOpenError, call_with_retries, async_call_with_retries
+from core.providers import Claim, Provider, get_router
+from core.prompts import STORY_SCENES, SYSTEM_PROMPT
+from core import metrics
+from core import aio
 import logging
-from dotenv import load_dotenv
-
-load_dotenv()
+from typing import Callable, List, Optional
 
 logging.basicConfig(level=logging.INFO)
 
-SYSTEM_PROMPT = """You are a charming and witty romantic comedy screenwriter with expertise in both classic rom-coms and modern love stories. You specialize in blending real-life moments with fictional elements while maintaining warmth and authenticity.
+LLM_REQUEST_DEADLINE_SECONDS = float(os.getenv('LLM_REQUEST_DEADLINE_SECONDS', '90'))
+LLM_MAX_ATTEMPTS = int(os.getenv('LLM_MAX_ATTEMPTS', '4'))
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+# Gets each scene as soon as it has streamed in, and None when a retry or failover
+# starts the story over, so the scenes reported until then must be dropped.
+OnScene = Callable[[Optional[dict]], None]
+
+# Shared by every session in the process so bursts are smoothed before they reach the API.
+_rate_limiter = TokenBucket(
+    rate=float(os.getenv('LLM_RATE_PER_SECOND', '2')),
+    capacity=float(os.getenv('LLM_RATE_BURST', '10')),
+)
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+_inflight = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+# Counterpart of _inflight for coroutines on core.aio's loop; hedges take a slot too.
+_async_inflight = AsyncSlots(LLM_MAX_CONCURRENCY)
+# Ceiling on generated tokens per completion; five scenes usually take well under half.
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv('LLM_MAX_OUTPUT_TOKENS', '4096'))
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "GeneratedContent",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "title": {
+                    "type": "string",
+                    "description": "Creative romantic comedy title"
+                },
+                "scenes": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "scene_number": {
+                                "type": "integer",
+                                "minimum": 1,
+                                "maximum": STORY_SCENES
+                            },
+                            "content": {
+                                "type": "string",
+                                "description": "Story content mixing real and fictional elements"
+                            },
+                            "quiz": {
+                                "type": "object",
+                                "properties": {
+                                    "question": {
+                                        "type": "string",
+                                        "description": "Multiple choice question about the scene"
+                                    },
+                                    "options": {
+                                        "type": "array",
+                                        "items": {
+                                            "type": "string"
+                                        },
+                                        "minItems": 3,
+                                        "maxItems": 3
+                                    },
+                                    "correct_index": {
+                                        "type": "integer",
+                                        "minimum": 0,
+                                        "maximum": 2
+                                    }
+                                },
+                                "required": ["question", "options", "correct_index"]
+                            },
+                            "commentary": {
+                                "type": "string",
+                                "description": "Humorous director's commentary about the scene"
+                            }
+                        },
+                        "required": ["scene_number", "content", "quiz", "commentary"]
+                    },
+                    "minItems": STORY_SCENES,
+                    "maxItems": STORY_SCENES
+                },
+                "bloopers": {
+                    "type": "array",
+                    "items": {
+                        "type": "string",
+                        "description": "Funny reactions to wrong quiz answers"
+                    },
+                    "minItems": 1
+                }
+            },
+            "additionalProperties": False,
+            "required": ["title", "scenes", "bloopers"]
+        }
+    }
+}
 
-Key characteristics of your writing:
-- You seamlessly weave actual memories into larger narrative arcs
-- You create humor through situational comedy, not sarcasm or mockery
-- Your tone is playful and light-hearted, but never cynical
-- You respect the authenticity of real relationships while adding entertaining embellishments
-- You write inclusive, contemporary stories that avoid stereotypes and clichés
 
-When generating content:
-1. Treat the provided memories as anchor points for your story
-2. Use the personal facts to create natural quiz moments within scenes
-3. Add fictional elements that complement but don't overshadow real events
-4. Create plausible alternative options for quizzes that are funny without being ridiculous
-5. Write director's commentary in the style of a cheerful, romantic optimist
+def _may_hedge() -> bool:
+    """A hedge is one more request in flight: it needs a free slot and rate-limiter room"""
+    if not _async_inflight.try_acquire():
+        return False
+    if not _rate_limiter.try_acquire():
+        _async_inflight.release()
+        return False
+    return True
+
+
+class SceneStreamParser:
+    """Incrementally scans streamed JSON and returns each scene once it is complete.
+
+    Only the structure needed to find elements of the top-level "scenes" array is
+    tracked (nesting depth, strings and the last top-level key), so each chunk is
+    scanned once and every finished scene object is decoded exactly once.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_key = None
+        self._in_scenes = False
+        self._scene_start = None
+
+    def feed(self, chunk: str) -> List[dict]:
+        scenes = []
+        self._text += chunk
+        text = self._text
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = text[self._string_start + 1:i]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if self._depth == 1 and ch == "[" and self._last_key == "scenes":
+                    self._in_scenes = True
+                elif self._depth == 2 and ch == "{" and self._in_scenes:
+                    self._scene_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 2 and ch == "}" and self._scene_start is not None:
+                    try:
+                        scenes.append(json.loads(text[self._scene_start:i + 1]))
+                    except json.JSONDecodeError as e:
+                        logging.warning(f"Skipping unparseable streamed scene: {e}")
+                    self._scene_start = None
+                elif self._depth == 1 and ch == "]":
+                    self._in_scenes = False
+            i += 1
 
-Your goal is to celebrate the unique aspects of each relationship while creating an entertaining interactive experience. The story should feel like a personalized romantic comedy that captures both factual elements and the spirit of the couple's connection.
+        # Drop text that can no longer be part of a pending scene.
+        keep_from = self._scene_start if self._scene_start is not None else i
+        if self._in_string and self._depth == 1:
+            keep_from = min(keep_from, self._string_start)
+        self._buffer.append(text[:keep_from])
+        self._text = text[keep_from:]
+        self._pos = i - keep_from
+        if self._scene_start is not None:
+            self._scene_start -= keep_from
+        self._string_start -= keep_from
+        return scenes
 
-Remember to:
-- Keep scenes concise but vivid
-- Balance humor with heart
-- Make quiz questions feel natural within the narrative
-- Create bloopers that are encouraging rather than embarrassing
-- Maintain consistent narrative voice throughout
+    def text(self) -> str:
+        """Return everything fed so far"""
+        return "".join(self._buffer) + self._text
 
-Format all output as valid JSON according to the specified schema."""
 
 class DeepSeekClient:
     def __init__(self):
-        self.api_key = os.getenv('OPENAI_API_KEY')
-        if not self.api_key:
-            raise ValueError("OPENAI_API_KEY not found in environment variables")
-        
-        self.client = OpenAI(
-            api_key=self.api_key,
-        )
-
-    def generate_story_content(self, prompt: str) -> GeneratedContent:
+        self.router = get_router()
+
+    def generate_story_content(
+        self,
+        prompt: str,
+        on_scene: Optional[OnScene] = None
+    ) -> GeneratedContent:
+        """Generate story content; with on_scene, stream and report each finished scene"""
+        if self.router.hedge:
+            # Hedging needs cancellable requests, so run the async path and hand
+            # streamed scenes back to this thread.
+            return aio.run_with_events(
+                lambda emit: self.agenerate_story_content(prompt, on_scene=emit if on_scene else None),
+                on_scene or (lambda scene: None)
+            )
+        deadline = time.monotonic() + LLM_REQUEST_DEADLINE_SECONDS
+        emitted = {"count": 0}
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt}
-                          ],
-                temperature=0.7,
-                response_format={
-                                "type": "json_schema",
-                                "json_schema": {
-                                    "name": "GeneratedContent",
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "title": {
-                                            "type": "string",
-                                            "description": "Creative romantic comedy title"
-                                            },
-                                            "scenes": {
-                                            "type": "array",
-                                            "items": {
-                                                "type": "object",
-                                                "properties": {
-                                                "scene_number": {
-                                                    "type": "integer",
-                                                    "minimum": 1,
-                                                    "maximum": 5
-                                                },
-                                                "content": {
-                                                    "type": "string",
-                                                    "description": "Story content mixing real and fictional elements"
-                                                },
-                                                "quiz": {
-                                                    "type": "object",
-                                                    "properties": {
-                                                    "question": {
-                                                        "type": "string",
-                                                        "description": "Multiple choice question about the scene"
-                                                    },
-                                                    "options": {
-                                                        "type": "array",
-                                                        "items": {
-                                                        "type": "string"
-                                                        },
-                                                        "minItems": 3,
-                                                        "maxItems": 3
-                                                    },
-                                                    "correct_index": {
-                                                        "type": "integer",
-                                                        "minimum": 0,
-                                                        "maximum": 2
-                                                    }
-                                                    },
-                                                    "required": ["question", "options", "correct_index"]
-                                                },
-                                                "commentary": {
-                                                    "type": "string",
-                                                    "description": "Humorous director's commentary about the scene"
-                                                }
-                                                },
-                                                "required": ["scene_number", "content", "quiz", "commentary"]
-                                            },
-                                            "minItems": 5,
-                                            "maxItems": 5
-                                            },
-                                            "bloopers": {
-                                            "type": "array",
-                                            "items": {
-                                                "type": "string",
-                                                "description": "Funny reactions to wrong quiz answers"
-                                            },
-                                            "minItems": 1
-                                            }
-                                        },
-                                        "additionalProperties": False,
-                                        "required": ["title", "scenes", "bloopers"]
-                                            }
-                                        }
-                                },
+            messages = [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ]
+            raw_content = call_with_retries(
+                lambda remaining: self._complete(messages, on_scene, emitted, remaining),
+                retryable=RETRYABLE_ERRORS,
+                deadline=deadline,
+                max_attempts=LLM_MAX_ATTEMPTS,
+                operation="llm_completion",
             )
-            
-            raw_content = response.choices[0].message.content
-            logging.info(f"API Response: {raw_content}")
-            
-            parsed = json.loads(raw_content)
-            
-            if not all(key in parsed for key in ["title", "scenes", "bloopers"]):
-                raise ValueError("Invalid JSON structure in API response")
-            
-            return GeneratedContent(**parsed)
+
+            return self._parse_content(raw_content)
+        except (APIConnectionError, APIError, RateLimitError, DeadlineExceeded, CircuitOpenError) as e:
+            logging.error(f"API Error: {str(e)}")
+            raise
+
+    async def agenerate_story_content(
+        self,
+        prompt: str,
+        on_scene: Optional[OnScene] = None
+    ) -> GeneratedContent:
+        """generate_story_content on AsyncOpenAI; run it on core.aio's loop"""
+        deadline = time.monotonic() + LLM_REQUEST_DEADLINE_SECONDS
+        emitted = {"count": 0}
+        try:
+            messages = [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ]
+            raw_content = await async_call_with_retries(
+                lambda remaining: self._acomplete(messages, on_scene, emitted, remaining),
+                retryable=RETRYABLE_ERRORS,
+                deadline=deadline,
+                max_attempts=LLM_MAX_ATTEMPTS,
+                operation="llm_completion",
+            )
+            return self._parse_content(raw_content)
+        except (APIConnectionError, APIError, RateLimitError, DeadlineExceeded, CircuitOpenError) as e:
+            logging.error(f"API Error: {str(e)}")
+            raise
+
+    def _parse_content(self, raw_content: str) -> GeneratedContent:
+        logging.info(f"API Response: {raw_content}")
+        try:
+            with metrics.timer("llm_parse"):
+                parsed = json.loads(raw_content)
+                
+                if not all(key in parsed for key in ["title", "scenes", "bloopers"]):
+                    raise ValueError("Invalid JSON structure in API response")
+                
+                return GeneratedContent(**parsed)
             
         except json.JSONDecodeError as e:
             logging.error(f"JSON Decode Error: {e}\nResponse Content: {raw_content}")
             raise ValueError("Failed to parse AI response")
-        except (APIConnectionError, APIError, RateLimitError) as e:
-            logging.error(f"API Error: {str(e)}")
-            raise
         except KeyError as e:
             logging.error(f"Missing key in response: {e}")
-            raise ValueError("Invalid API response format")
\ No newline at end of file
+            raise ValueError("Invalid API response format")
+        except ValidationError as e:
+            logging.error(f"Response failed validation: {e}\nResponse Content: {raw_content}")
+            raise ValueError("Invalid API response format")
+
+    def _complete(
+        self,
+        messages: List[dict],
+        on_scene: Optional[OnScene],
+        emitted: dict,
+        timeout: float
+    ) -> str:
+        """Run one completion attempt under the shared rate and concurrency limits"""
+        deadline = time.monotonic() + timeout
+        if not _rate_limiter.acquire(deadline=deadline):
+            raise DeadlineExceeded("Timed out waiting for the LLM rate limiter")
+        if not _inflight.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise DeadlineExceeded("Timed out waiting for an LLM request slot")
+        try:
+            remaining = max(0.1, deadline - time.monotonic())
+            return self.router.call(
+                lambda provider, claim: self._attempt(provider, claim, messages, on_scene, emitted, remaining),
+                retryable=RETRYABLE_ERRORS,
+                mode="sync" if on_scene is None else "stream",
+            )
+        finally:
+            _inflight.release()
+
+    def _attempt(
+        self,
+        provider: Provider,
+        claim: Claim,
+        messages: List[dict],
+        on_scene: Optional[OnScene],
+        emitted: dict,
+        timeout: float
+    ) -> Optional[str]:
+        """One request to one provider"""
+        start = time.monotonic()
+        if on_scene is None:
+            with metrics.timer("llm_completion", mode="sync", provider=provider.name):
+                response = provider.client.chat.completions.create(
+                    model=provider.model,
+                    messages=messages,
+                    temperature=0.7,
+                    response_format=RESPONSE_FORMAT,
+                    max_tokens=LLM_MAX_OUTPUT_TOKENS,
+                    timeout=timeout,
+                )
+            claim()
+            metrics.record_usage(response.usage, provider.model, provider.name, time.monotonic() - start)
+            return response.choices[0].message.content
+
+        parser = SceneStreamParser()
+        seen = 0
+        claimed = False
+        with metrics.timer("llm_completion", mode="stream", provider=provider.name):
+            stream = provider.client.chat.completions.create(
+                model=provider.model,
+                messages=messages,
+                temperature=0.7,
+                response_format=RESPONSE_FORMAT,
+                max_tokens=LLM_MAX_OUTPUT_TOKENS,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=timeout,
+            )
+            for chunk in stream:
+                if not claimed:
+                    claimed = claim()
+                seen = self._consume_chunk(chunk, provider, start, parser, on_scene, emitted, seen)
+        return parser.text()
+
+    async def _acomplete(
+        self,
+        messages: List[dict],
+        on_scene: Optional[OnScene],
+        emitted: dict,
+        timeout: float
+    ) -> str:
+        """_complete for the async backend, hedged when LLM_HEDGE is on"""
+        deadline = time.monotonic() + timeout
+        if not await _rate_limiter.acquire_async(deadline=deadline):
+            raise DeadlineExceeded("Timed out waiting for the LLM rate limiter")
+        if not await _async_inflight.acquire(deadline=deadline):
+            raise DeadlineExceeded("Timed out waiting for an LLM request slot")
+        try:
+            remaining = max(0.1, deadline - time.monotonic())
+            return await self.router.acall(
+                lambda provider, claim: self._aattempt(provider, claim, messages, on_scene, emitted, remaining),
+                retryable=RETRYABLE_ERRORS,
+                mode="sync" if on_scene is None else "stream",
+                may_hedge=_may_hedge,
+                hedge_done=_async_inflight.release,
+            )
+        finally:
+            _async_inflight.release()
+
+    async def _aattempt(
+        self,
+        provider: Provider,
+        claim: Claim,
+        messages: List[dict],
+        on_scene: Optional[OnScene],
+        emitted: dict,
+        timeout: float
+    ) -> Optional[str]:
+        """_attempt on the provider's AsyncOpenAI client"""
+        start = time.monotonic()
+        if on_scene is None:
+            with metrics.timer("llm_completion", mode="sync", provider=provider.name, backend="async"):
+                response = await provider.async_client.chat.completions.create(
+                    model=provider.model,
+                    messages=messages,
+                    temperature=0.7,
+                    response_format=RESPONSE_FORMAT,
+                    max_tokens=LLM_MAX_OUTPUT_TOKENS,
+                    timeout=timeout,
+                )
+            if not claim():
+                return None
+            metrics.record_usage(response.usage, provider.model, provider.name, time.monotonic() - start)
+            return response.choices[0].message.content
+
+        parser = SceneStreamParser()
+        seen = 0
+        claimed = False
+        with metrics.timer("llm_completion", mode="stream", provider=provider.name, backend="async"):
+            stream = await provider.async_client.chat.completions.create(
+                model=provider.model,
+                messages=messages,
+                temperature=0.7,
+                response_format=RESPONSE_FORMAT,
+                max_tokens=LLM_MAX_OUTPUT_TOKENS,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=timeout,
+            )
+            async for chunk in stream:
+                if not claimed:
+                    if not claim():
+                        await stream.close()
+                        return None
+                    claimed = True
+                seen = self._consume_chunk(chunk, provider, start, parser, on_scene, emitted, seen)
+        return parser.text()
+
+    def _consume_chunk(
+        self,
+        chunk,
+        provider: Provider,
+        start: float,
+        parser: "SceneStreamParser",
+        on_scene: OnScene,
+        emitted: dict,
+        seen: int
+    ) -> int:
+        """Feed one stream chunk to the parser and report newly finished scenes.
+
+        A later attempt writes a different story, so before its first scene the
+        scenes of the failed attempt are withdrawn with on_scene(None).
+        """
+        if getattr(chunk, "usage", None) is not None:
+            # The usage chunk is the last one, so this is the whole request's latency.
+            metrics.record_usage(chunk.usage, provider.model, provider.name, time.monotonic() - start)
+        if not chunk.choices:
+            return seen
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            return seen
+        for scene in parser.feed(delta):
+            if seen == 0 and emitted["count"]:
+                on_scene(None)
+            seen += 1
+            emitted["count"] = seen
+            on_scene(scene)
+        return seen
@@ -0,0 +1,112 @@
+import os
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Coroutine, Optional
+
+# "async" routes generation, Mongo and poster I/O through the shared event loop below.
+IO_BACKEND = os.getenv('IO_BACKEND', 'sync')
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_clients_lock = threading.Lock()
+_async_openai = None
+_async_mongo = None
+_async_http = None
+
+
+def use_async() -> bool:
+    return IO_BACKEND == 'async'
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Return the process-wide event loop, started on a daemon thread on first use"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                threading.Thread(target=run, name="aio-loop", daemon=True).start()
+                ready.wait()
+                _loop = loop
+    return _loop
+
+
+def submit(coro: Coroutine) -> Future:
+    """Schedule a coroutine on the shared loop from any thread"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run_sync(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """Run a coroutine on the shared loop and block the calling thread for its result"""
+    return submit(coro).result(timeout)
+
+
+def run_with_events(
+    start: Callable[[Callable[[Any], None]], Awaitable[Any]],
+    on_event: Callable[[Any], None],
+    poll_interval: float = 0.05
+) -> Any:
+    """Run start(emit) on the loop, delivering emitted events to on_event in this thread.
+
+    Streamlit calls must happen on the script thread, so coroutines that want to
+    report progress (for example streamed scenes) hand events over a queue.
+    """
+    events: "queue.Queue" = queue.Queue()
+    future = submit(start(events.put))
+    while True:
+        try:
+            on_event(events.get(timeout=poll_interval))
+        except queue.Empty:
+            if future.done():
+                break
+    while not events.empty():
+        on_event(events.get_nowait())
+    return future.result()
+
+
+def get_async_openai():
+    """Shared AsyncOpenAI client; retries are handled by core.resilience"""
+    global _async_openai
+    if _async_openai is None:
+        with _clients_lock:
+            if _async_openai is None:
+                from openai import AsyncOpenAI
+                _async_openai = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+    return _async_openai
+
+
+def get_async_mongo():
+    """Shared pymongo AsyncMongoClient with the same pool settings as the sync client"""
+    global _async_mongo
+    if _async_mongo is None:
+        with _clients_lock:
+            if _async_mongo is None:
+                from pymongo import AsyncMongoClient
+                from core.database import client_options
+                _async_mongo = AsyncMongoClient(os.getenv('MONGODB_URI'), **client_options())
+    return _async_mongo
+
+
+def get_async_http():
+    """Shared httpx.AsyncClient, or None when httpx is not installed"""
+    global _async_http
+    if _async_http is None:
+        with _clients_lock:
+            if _async_http is None:
+                try:
+                    import httpx
+                except ImportError:
+                    return None
+                _async_http = httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=int(os.getenv('POSTER_WORKERS', '2')) * 2)
+                )
+    return _async_http
@@ -0,0 +1,103 @@
+"""Move cold stories out of the working set.
+
+Stories not read for --idle-days are compressed (zlib over BSON) into the
+valz_archive collection and removed from valz. Database.get_story falls back
+to the archive, so links keep working. Safe to interrupt and re-run:
+
+    python -m core.archive --idle-days 30
+"""
+from dotenv import load_dotenv
+
+if __name__ == "__main__":
+    # Run as a command: read .env before the imports below read their settings.
+    load_dotenv()
+
+import os
+import sys
+import json
+import zlib
+import argparse
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+import bson
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+from core.database import Database, ensure_indexes
+from core import metrics
+
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv('ARCHIVE_COMPRESSION_LEVEL', '6'))
+DUPLICATE_KEY = 11000
+
+
+def cold_query(idle_seconds: float) -> Dict:
+    """Stories whose last read is older than idle_seconds"""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=idle_seconds)
+    return {"$or": [
+        {"last_read_at": {"$lt": cutoff}},
+        # Stories saved before last_read_at was recorded: fall back to the id's timestamp.
+        {"last_read_at": {"$exists": False}, "_id": {"$lt": ObjectId.from_datetime(cutoff)}},
+    ]}
+
+
+def compress_story(doc: Dict, archived_at: datetime) -> Dict:
+    body = {k: v for k, v in doc.items() if k != "_id"}
+    archived = {
+        "_id": doc["_id"],
+        "z": bson.Binary(zlib.compress(bson.encode(body), ARCHIVE_COMPRESSION_LEVEL)),
+        "archived_at": archived_at,
+    }
+    if doc.get("expires_at") is not None:
+        archived["expires_at"] = doc["expires_at"]
+    return archived
+
+
+def archive_cold_stories(
+    db: Database,
+    idle_seconds: float,
+    batch_size: int = 200,
+    limit: Optional[int] = None
+) -> Dict[str, int]:
+    """Copy cold stories into the archive, then delete them from valz, batch by batch"""
+    query = cold_query(idle_seconds)
+    counts = {"archived": 0, "bytes_before": 0, "bytes_after": 0}
+    while limit is None or counts["archived"] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - counts["archived"])
+        docs: List[Dict] = list(db.stories.find(query).limit(size))
+        if not docs:
+            break
+        now = datetime.now(timezone.utc)
+        archived = [compress_story(doc, now) for doc in docs]
+        try:
+            db.archive.insert_many(archived, ordered=False)
+        except BulkWriteError as e:
+            # Left over from an interrupted run: the archive copy already exists.
+            if any(err.get("code") != DUPLICATE_KEY for err in e.details.get("writeErrors", [])):
+                raise
+        db.stories.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+
+        counts["archived"] += len(docs)
+        counts["bytes_before"] += sum(len(bson.encode(doc)) for doc in docs)
+        counts["bytes_after"] += sum(len(bson.encode(doc)) for doc in archived)
+        metrics.inc("lovereel_archived_stories_total", len(docs))
+    return counts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--idle-days", type=float, default=float(os.getenv('ARCHIVE_IDLE_DAYS', '30')),
+                        help="archive stories not read for this many days")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--limit", type=int, help="archive at most this many stories")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    db = Database()
+    ensure_indexes(db.client)
+    counts = archive_cold_stories(db, args.idle_days * 86400, args.batch_size, args.limit)
+    print(json.dumps(counts))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
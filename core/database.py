@@ -1,28 +1,323 @@
-
 import os
-from pymongo import MongoClient
+import zlib
+import threading
+import logging
+from datetime import datetime, timedelta, timezone
+import bson
+from pymongo import ASCENDING, IndexModel, MongoClient
+from pymongo.errors import BulkWriteError, PyMongoError
 from bson.objectid import ObjectId
+from core.cache import TTLCache
+from core import metrics
+from core.views import RecipientView, decode_view, encode_story, is_current
 from models.schemas import StoryCreate, GeneratedContent
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
+
+_client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
+
+# Stories are immutable once saved, so recipient reads can be served from memory.
+story_cache = TTLCache(
+    name="story",
+    maxsize=int(os.getenv('STORY_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('STORY_CACHE_TTL_SECONDS', '3600')),
+)
+
+# Ids confirmed not to exist, so repeated lookups of bad links skip the database.
+missing_story_cache = TTLCache(
+    name="story_missing",
+    maxsize=int(os.getenv('MISSING_STORY_CACHE_SIZE', '4096')),
+    ttl=float(os.getenv('MISSING_STORY_CACHE_TTL_SECONDS', '300')),
+)
+
+STORIES_COLLECTION = "valz"
+ARCHIVE_COLLECTION = "valz_archive"
+JOBS_COLLECTION = "jobs"
+RESULTS_COLLECTION = "results"
+STORY_STATS_COLLECTION = "story_stats"
+# Default lifetime of a story; 0 keeps stories until they are deleted.
+STORY_TTL_DAYS = float(os.getenv('STORY_TTL_DAYS', '0'))
+# last_read_at is refreshed at most this often, so reads rarely cost a write.
+READ_TOUCH_INTERVAL_SECONDS = float(os.getenv('READ_TOUCH_INTERVAL_SECONDS', '86400'))
+
+RECIPIENT_PROJECTION = {"story": 1, "last_read_at": 1}
+LEGACY_PROJECTION = {"content": 1}
+
+_indexes_ready = False
+_indexes_lock = threading.Lock()
+
+
+def get_client() -> MongoClient:
+    """Return the process-wide pooled MongoClient, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(os.getenv('MONGODB_URI'), **client_options())
+    return _client
 
-class Database:
-    def __init__(self):
-        self.client = MongoClient(os.getenv('MONGODB_URI'))
-        self.db = self.client[os.getenv('DB_NAME')]
-        self.stories = self.db["valz"]
 
-    def save_story(self, story_data: StoryCreate, generated_content: GeneratedContent) -> str:
+def client_options() -> Dict:
+    """Pool and timeout settings shared by the sync and async clients"""
+    return {
+        "maxPoolSize": int(os.getenv('MONGODB_MAX_POOL_SIZE', '50')),
+        "minPoolSize": int(os.getenv('MONGODB_MIN_POOL_SIZE', '0')),
+        "maxIdleTimeMS": int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', '300000')),
+        "serverSelectionTimeoutMS": int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+        "heartbeatFrequencyMS": int(os.getenv('MONGODB_HEARTBEAT_FREQUENCY_MS', '10000')),
+    }
+
+
+def check_health() -> bool:
+    """Ping the server through the shared client"""
+    try:
+        get_client().admin.command('ping')
+        return True
+    except PyMongoError as e:
+        logging.error(f"MongoDB health check failed: {str(e)}")
+        return False
+
+
+def ensure_indexes(client: Optional[MongoClient] = None) -> bool:
+    """Create the story, archive, job and result indexes once per process"""
+    global _indexes_ready
+    if _indexes_ready:
+        return True
+    with _indexes_lock:
+        if _indexes_ready:
+            return True
+        db = (client or get_client())[os.getenv('DB_NAME')]
+        try:
+            db[STORIES_COLLECTION].create_indexes([
+                # Documents without expires_at never expire.
+                IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+                IndexModel([("last_read_at", ASCENDING)], name="last_read_at"),
+            ])
+            db[ARCHIVE_COLLECTION].create_indexes([
+                IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+            ])
+            db[JOBS_COLLECTION].create_indexes([
+                IndexModel([("key", ASCENDING), ("state", ASCENDING)], name="key_state"),
+                IndexModel([("state", ASCENDING), ("updated_at", ASCENDING)], name="state_updated_at"),
+                IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+            ])
+            db[RESULTS_COLLECTION].create_indexes([
+                IndexModel([("story_id", ASCENDING), ("created_at", ASCENDING)], name="story_created_at"),
+            ])
+        except PyMongoError as e:
+            logging.error(f"Index creation failed: {str(e)}")
+            return False
+        _indexes_ready = True
+        return True
+
+
+def _utc(value: datetime) -> datetime:
+    """pymongo returns naive UTC datetimes unless the client is tz_aware"""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class _StoryDocuments:
+    def _story_document(
+        self,
+        story_data: StoryCreate,
+        generated_content: GeneratedContent,
+        expires_in: Optional[float] = None
+    ) -> Dict:
+        now = datetime.now(timezone.utc)
         doc = {
             "meta": story_data.dict(),
-            "content": generated_content.dict(),
-            "access_key": self._generate_access_key()
+            "story": encode_story(generated_content),
+            "created_at": now,
+            "last_read_at": now,
         }
-        result = self.stories.insert_one(doc)
+        if expires_in is None:
+            expires_in = STORY_TTL_DAYS * 86400
+        if expires_in > 0:
+            doc["expires_at"] = now + timedelta(seconds=expires_in)
+        return doc
+
+    def _from_archive(self, archived: Optional[Dict], projection: Optional[Dict]) -> Optional[Dict]:
+        """Decompress an archived story, keeping only the projected top-level fields"""
+        if archived is None:
+            return None
+        metrics.inc("lovereel_archive_reads_total")
+        doc = bson.decode(zlib.decompress(archived["z"]))
+        doc["_id"] = archived["_id"]
+        if projection:
+            doc = {k: v for k, v in doc.items() if k == "_id" or projection.get(k)}
+        return doc
+
+    def _touch_update(self, doc: Dict) -> Optional[Dict]:
+        """Update refreshing last_read_at, or None while it is recent enough"""
+        now = datetime.now(timezone.utc)
+        last_read = doc.get("last_read_at")
+        if last_read is not None and (now - _utc(last_read)).total_seconds() < READ_TOUCH_INTERVAL_SECONDS:
+            return None
+        return {"$set": {"last_read_at": now}}
+
+    def _migration(self, story_id: str, legacy: Optional[Dict]) -> Optional[Tuple[Dict, Dict]]:
+        """Encoding and update for a document saved in the old "content" layout"""
+        if legacy is None or "content" not in legacy:
+            logging.error(f"Story {story_id} has no readable content")
+            return None
+        encoded = encode_story(GeneratedContent(**legacy["content"]))
+        return encoded, {"$set": {"story": encoded}, "$unset": {"content": "", "view": ""}}
+
+
+class Database(_StoryDocuments):
+    def __init__(self, client: Optional[MongoClient] = None):
+        self.client = client or get_client()
+        self.db = self.client[os.getenv('DB_NAME')]
+        self.stories = self.db[STORIES_COLLECTION]
+        self.archive = self.db[ARCHIVE_COLLECTION]
+
+    def save_story(
+        self,
+        story_data: StoryCreate,
+        generated_content: GeneratedContent,
+        expires_in: Optional[float] = None
+    ) -> str:
+        """Insert a story; expires_in (seconds) overrides STORY_TTL_DAYS, 0 keeps it forever"""
+        doc = self._story_document(story_data, generated_content, expires_in)
+        with metrics.timer("db_insert", collection="valz"):
+            result = self.stories.insert_one(doc)
         return str(result.inserted_id)
-    
-    def get_story(self, story_id: str) -> Optional[Dict]:
-        return self.stories.find_one({"_id": ObjectId(story_id)})
 
-    def _generate_access_key(self) -> str:
-        import secrets
-        return secrets.token_urlsafe(16)    
\ No newline at end of file
+    def save_stories(
+        self,
+        stories: List[Tuple[StoryCreate, GeneratedContent]],
+        expires_in: Optional[float] = None
+    ) -> List[Optional[str]]:
+        """Insert many stories in one ordered round trip.
+
+        Ids are returned in input order; if the batch fails part way, stories
+        after the failure point come back as None.
+        """
+        if not stories:
+            return []
+        docs = [self._story_document(s, c, expires_in) for s, c in stories]
+        try:
+            with metrics.timer("db_insert_many", collection="valz"):
+                result = self.stories.insert_many(docs, ordered=True)
+            return [str(i) for i in result.inserted_ids]
+        except BulkWriteError as e:
+            inserted = e.details.get("nInserted", 0)
+            logging.error(f"Batch insert stopped after {inserted} of {len(docs)} stories: {str(e)}")
+            return [str(d["_id"]) for d in docs[:inserted]] + [None] * (len(docs) - inserted)
+
+    def get_story(self, story_id: str, projection: Optional[Dict] = None) -> Optional[Dict]:
+        """Fetch a story, falling back to the archive for stories moved there"""
+        query = {"_id": ObjectId(story_id)}
+        with metrics.timer("db_find", collection="valz"):
+            doc = self.stories.find_one(query, projection)
+        if doc is not None:
+            return doc
+        with metrics.timer("db_find", collection="valz_archive"):
+            return self._from_archive(self.archive.find_one(query), projection)
+
+    @staticmethod
+    def is_cached(story_id: str) -> bool:
+        """Whether get_recipient_story answers story_id from memory, without a query"""
+        return story_id in story_cache or story_id in missing_story_cache
+
+    def get_recipient_story(self, story_id: str) -> Optional[RecipientView]:
+        """Read-through cached fetch of the story's decoded recipient view"""
+        if not ObjectId.is_valid(story_id) or missing_story_cache.get(story_id):
+            return None
+        view = story_cache.get_or_load(story_id, lambda: self._load_recipient_view(story_id))
+        if view is None:
+            missing_story_cache.set(story_id, True)
+        return view
+
+    def _load_recipient_view(self, story_id: str) -> Optional[RecipientView]:
+        doc = self.get_story(story_id, RECIPIENT_PROJECTION)
+        if doc is None:
+            return None
+        encoded = doc.get("story")
+        if not is_current(encoded):
+            # Saved before the compact encoding: re-encode once and slim the document.
+            migration = self._migration(story_id, self.get_story(story_id, LEGACY_PROJECTION))
+            if migration is None:
+                return None
+            encoded, update = migration
+            try:
+                with metrics.timer("db_update", collection="valz"):
+                    self.stories.update_one({"_id": doc["_id"]}, update)
+                metrics.inc("lovereel_story_migrations_total")
+            except PyMongoError as e:
+                logging.error(f"Failed to re-encode story {story_id}: {str(e)}")
+        touch = self._touch_update(doc)
+        if touch is not None:
+            try:
+                self.stories.update_one({"_id": doc["_id"]}, touch)
+            except PyMongoError as e:
+                logging.error(f"Failed to record read of story {story_id}: {str(e)}")
+        return decode_view(encoded)
+
+
+class AsyncDatabase(_StoryDocuments):
+    """Database counterpart on pymongo's AsyncMongoClient; use from core.aio's loop"""
+
+    def __init__(self, client=None):
+        from core.aio import get_async_mongo
+        self.client = client or get_async_mongo()
+        self.db = self.client[os.getenv('DB_NAME')]
+        self.stories = self.db[STORIES_COLLECTION]
+        self.archive = self.db[ARCHIVE_COLLECTION]
+
+    async def save_story(
+        self,
+        story_data: StoryCreate,
+        generated_content: GeneratedContent,
+        expires_in: Optional[float] = None
+    ) -> str:
+        doc = self._story_document(story_data, generated_content, expires_in)
+        with metrics.timer("db_insert", collection="valz", backend="async"):
+            result = await self.stories.insert_one(doc)
+        return str(result.inserted_id)
+
+    async def get_story(self, story_id: str, projection: Optional[Dict] = None) -> Optional[Dict]:
+        query = {"_id": ObjectId(story_id)}
+        with metrics.timer("db_find", collection="valz", backend="async"):
+            doc = await self.stories.find_one(query, projection)
+        if doc is not None:
+            return doc
+        with metrics.timer("db_find", collection="valz_archive", backend="async"):
+            return self._from_archive(await self.archive.find_one(query), projection)
+
+    async def get_recipient_story(self, story_id: str) -> Optional[RecipientView]:
+        """Read-through cached fetch sharing the sync path's caches"""
+        if not ObjectId.is_valid(story_id) or missing_story_cache.get(story_id):
+            return None
+        view = story_cache.get(story_id)
+        if view is None:
+            view = await self._load_recipient_view(story_id)
+            if view is None:
+                missing_story_cache.set(story_id, True)
+            else:
+                story_cache.set(story_id, view)
+        return view
+
+    async def _load_recipient_view(self, story_id: str) -> Optional[RecipientView]:
+        doc = await self.get_story(story_id, RECIPIENT_PROJECTION)
+        if doc is None:
+            return None
+        encoded = doc.get("story")
+        if not is_current(encoded):
+            migration = self._migration(story_id, await self.get_story(story_id, LEGACY_PROJECTION))
+            if migration is None:
+                return None
+            encoded, update = migration
+            try:
+                with metrics.timer("db_update", collection="valz", backend="async"):
+                    await self.stories.update_one({"_id": doc["_id"]}, update)
+                metrics.inc("lovereel_story_migrations_total")
+            except PyMongoError as e:
+                logging.error(f"Failed to re-encode story {story_id}: {str(e)}")
+        touch = self._touch_update(doc)
+        if touch is not None:
+            try:
+                await self.stories.update_one({"_id": doc["_id"]}, touch)
+            except PyMongoError as e:
+                logging.error(f"Failed to record read of story {story_id}: {str(e)}")
+        return decode_view(encoded)
@@ -0,0 +1,14 @@
+import os
+import json
+import hashlib
+from pydantic import BaseModel
+
+# Identical submissions from one session within this window reuse the first job.
+IDEMPOTENCY_WINDOW_SECONDS = float(os.getenv('IDEMPOTENCY_WINDOW_SECONDS', '900'))
+
+
+def payload_key(payload: BaseModel, scope: str) -> str:
+    """Canonical hash of a model's contents within a scope such as a session"""
+    canonical = json.dumps(payload.model_dump(mode="json"), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{scope}|{canonical}".encode("utf-8")).hexdigest()
+
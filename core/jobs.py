@@ -0,0 +1,288 @@
+import os
+import zlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from core.database import JOBS_COLLECTION, AsyncDatabase, Database, get_client, _utc
+from core.idempotency import IDEMPOTENCY_WINDOW_SECONDS
+from core.prompts import build_story_prompt
+from core.resilience import DeadlineExceeded, CircuitOpenError
+from core import metrics
+from core import aio
+from models.schemas import StoryCreate
+from utils.helpers import prefetch_posters
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+# Queued plus running jobs this process accepts before turning new ones away.
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', str(JOB_WORKERS * 4)))
+JOB_TTL_SECONDS = float(os.getenv('JOB_TTL_SECONDS', '86400'))
+# A queued or running job not updated for this long is assumed lost with its process.
+JOB_STALE_SECONDS = float(os.getenv('JOB_STALE_SECONDS', '300'))
+# Live jobs are touched this often, so only an abandoned job ever goes stale.
+JOB_HEARTBEAT_SECONDS = JOB_STALE_SECONDS / 3
+# Runs a job gets; one that keeps taking its process down is failed instead of re-queued.
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '2'))
+# Submissions with keys in different stripes never wait for each other.
+JOB_KEY_LOCKS = 64
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+def is_transient(error: BaseException) -> bool:
+    """Failures worth retrying as-is; the creator reports these as busy rather than broken"""
+    from openai import APIConnectionError, RateLimitError
+    return isinstance(error, (RateLimitError, APIConnectionError, DeadlineExceeded, CircuitOpenError))
+
+
+class QueueFull(RuntimeError):
+    """Raised when the job queue is at capacity"""
+
+
+class JobQueue:
+    """Story generation jobs: records in Mongo, work on a bounded thread pool.
+
+    A job moves queued -> running -> done (with story_id) or failed (with
+    error). Scenes are appended to the record as they stream in so any web
+    session can poll progress. The owning process touches its jobs every
+    JOB_HEARTBEAT_SECONDS; a queued or running job left untouched for
+    JOB_STALE_SECONDS lost its process, and is reported as failed when it is
+    next read or resubmitted. A new process re-queues any it finds at start,
+    unless they already had JOB_MAX_ATTEMPTS runs.
+    """
+
+    def __init__(self, workers: int, max_pending: int, client=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._client = client
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(JOB_KEY_LOCKS)]
+        self._recovered = False
+        self._owned = set()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    @property
+    def jobs(self):
+        return (self._client or get_client())[os.getenv('DB_NAME')][JOBS_COLLECTION]
+
+    def submit(self, story_data: StoryCreate, key: str) -> str:
+        """Queue a generation and return its job id.
+
+        A live or finished job with the same key created within
+        IDEMPOTENCY_WINDOW_SECONDS is reused instead.
+        """
+        # Only submissions of the same key need to agree on one job; _lock guards
+        # the counters alone, so no Mongo round trip is made while holding it.
+        with self._key_locks[zlib.crc32(key.encode()) % JOB_KEY_LOCKS]:
+            now = datetime.now(timezone.utc)
+            existing = self.jobs.find_one(
+                {
+                    "key": key,
+                    "state": {"$ne": FAILED},
+                    "created_at": {"$gte": now - timedelta(seconds=IDEMPOTENCY_WINDOW_SECONDS)},
+                },
+                {"_id": 1, "state": 1, "updated_at": 1},
+            )
+            if existing is not None and not self._fail_if_stale(existing):
+                return str(existing["_id"])
+            with self._lock:
+                if self._pending >= self.max_pending:
+                    metrics.inc("lovereel_jobs_rejected_total")
+                    raise QueueFull("Story generation queue is full")
+                self._pending += 1
+            try:
+                result = self.jobs.insert_one({
+                    "key": key,
+                    "state": QUEUED,
+                    "request": story_data.model_dump(),
+                    "scenes": [],
+                    "attempts": 0,
+                    "created_at": now,
+                    "updated_at": now,
+                    "expires_at": now + timedelta(seconds=JOB_TTL_SECONDS),
+                })
+            except Exception:
+                with self._lock:
+                    self._pending -= 1
+                raise
+        self._dispatch(result.inserted_id)
+        metrics.inc("lovereel_jobs_total", state=QUEUED)
+        return str(result.inserted_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Current job record without the original request; an abandoned job reads as failed"""
+        if not ObjectId.is_valid(job_id):
+            return None
+        job = self.jobs.find_one({"_id": ObjectId(job_id)}, {"request": 0})
+        if job is not None and self._fail_if_stale(job):
+            job = self.jobs.find_one({"_id": job["_id"]}, {"request": 0})
+        return job
+
+    def _fail_if_stale(self, job: Dict) -> bool:
+        """Mark a queued or running job whose process stopped touching it as failed"""
+        if job.get("state") not in (QUEUED, RUNNING):
+            return False
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_SECONDS)
+        if _utc(job["updated_at"]) >= cutoff:
+            return False
+        # Conditional, so a job touched since it was read is left alone.
+        result = self.jobs.update_one(
+            {"_id": job["_id"], "state": {"$in": [QUEUED, RUNNING]}, "updated_at": {"$lt": cutoff}},
+            {"$set": {
+                "state": FAILED,
+                "error": "Generation was interrupted",
+                "transient": True,
+                "updated_at": datetime.now(timezone.utc),
+            }},
+        )
+        if result.modified_count:
+            logging.warning(f"Generation job {job['_id']} was abandoned")
+            metrics.inc("lovereel_jobs_total", state=FAILED)
+        return True
+
+    def recover(self) -> int:
+        """Re-queue jobs abandoned by a dead process; runs once per process.
+
+        Jobs that already had JOB_MAX_ATTEMPTS runs are failed instead, so a
+        request that crashes its process is not re-run on every restart.
+        """
+        with self._lock:
+            if self._recovered:
+                return 0
+            self._recovered = True
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_SECONDS)
+        abandoned = {"state": {"$in": [QUEUED, RUNNING]}, "updated_at": {"$lt": cutoff}}
+        recovered = 0
+        for job in self.jobs.find(abandoned, {"_id": 1, "attempts": 1}):
+            if job.get("attempts", 0) >= JOB_MAX_ATTEMPTS:
+                result = self.jobs.update_one(
+                    dict(abandoned, _id=job["_id"]),
+                    {"$set": {
+                        "state": FAILED,
+                        "error": f"Generation was interrupted {job['attempts']} times",
+                        "transient": False,
+                        "updated_at": datetime.now(timezone.utc),
+                    }},
+                )
+                if result.modified_count:
+                    logging.error(f"Generation job {job['_id']} failed after {job['attempts']} interrupted runs")
+                    metrics.inc("lovereel_jobs_total", state=FAILED)
+                continue
+            claimed = self.jobs.find_one_and_update(
+                dict(abandoned, _id=job["_id"], attempts={"$lt": JOB_MAX_ATTEMPTS}),
+                {"$set": {"state": QUEUED, "scenes": [], "updated_at": datetime.now(timezone.utc)}},
+            )
+            if claimed is not None:
+                with self._lock:
+                    self._pending += 1
+                self._dispatch(job["_id"])
+                recovered += 1
+        if recovered:
+            logging.warning(f"Re-queued {recovered} abandoned generation jobs")
+        return recovered
+
+    def _dispatch(self, job_id: ObjectId) -> None:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+                    self._heartbeat = threading.Thread(target=self._run_heartbeat, name="job-heartbeat", daemon=True)
+                    self._heartbeat.start()
+        with self._lock:
+            self._owned.add(job_id)
+        self._executor.submit(self._run, job_id)
+
+    def _run_heartbeat(self) -> None:
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            with self._lock:
+                owned = list(self._owned)
+            if not owned:
+                continue
+            try:
+                self.jobs.update_many(
+                    {"_id": {"$in": owned}, "state": {"$in": [QUEUED, RUNNING]}},
+                    {"$set": {"updated_at": datetime.now(timezone.utc)}},
+                )
+            except Exception as e:
+                logging.error(f"Job heartbeat failed: {str(e)}")
+
+    def _run(self, job_id: ObjectId) -> None:
+        try:
+            job = self.jobs.find_one_and_update(
+                {"_id": job_id, "state": QUEUED},
+                {
+                    "$set": {"state": RUNNING, "updated_at": datetime.now(timezone.utc)},
+                    "$inc": {"attempts": 1},
+                },
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None:
+                return
+            with metrics.timer("job_run"):
+                story_id = produce_story(StoryCreate(**job["request"]), lambda scene: self._add_scene(job_id, scene))
+            self._finish(job_id, {"state": DONE, "story_id": story_id})
+        except Exception as e:
+            logging.error(f"Generation job {job_id} failed: {str(e)}")
+            self._finish(job_id, {
+                "state": FAILED,
+                "error": str(e),
+                "transient": is_transient(e),
+            })
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._owned.discard(job_id)
+
+    def _add_scene(self, job_id: ObjectId, scene: Optional[dict]) -> None:
+        """Append a streamed scene; None clears them because generation started over"""
+        now = datetime.now(timezone.utc)
+        if scene is None:
+            update = {"$set": {"scenes": [], "updated_at": now}}
+        else:
+            update = {"$push": {"scenes": scene}, "$set": {"updated_at": now}}
+        try:
+            self.jobs.update_one({"_id": job_id}, update)
+        except Exception as e:
+            logging.error(f"Failed to record scene for job {job_id}: {str(e)}")
+
+    def _finish(self, job_id: ObjectId, fields: Dict) -> None:
+        fields["updated_at"] = datetime.now(timezone.utc)
+        try:
+            self.jobs.update_one({"_id": job_id}, {"$set": fields})
+        except Exception as e:
+            logging.error(f"Failed to record outcome of job {job_id}: {str(e)}")
+        metrics.inc("lovereel_jobs_total", state=fields["state"])
+
+
+def produce_story(story_data: StoryCreate, on_scene: Callable[[Optional[dict]], None]) -> str:
+    """Generate, save and schedule posters for a story; returns its id.
+
+    on_scene gets each streamed scene, or None when generation starts over.
+    """
+    # Loaded here rather than at import so the creator form renders without openai.
+    from core.ai_client import DeepSeekClient
+
+    with metrics.timer("prompt_build"):
+        prompt = build_story_prompt(story_data)
+    if aio.use_async():
+        async def create(emit):
+            generated_content = await DeepSeekClient().agenerate_story_content(prompt, on_scene=emit)
+            # Posters start while the story is being saved.
+            prefetch_posters(len(generated_content.scenes))
+            return await AsyncDatabase().save_story(story_data, generated_content)
+        return aio.run_with_events(create, on_scene)
+
+    generated_content = DeepSeekClient().generate_story_content(prompt, on_scene=on_scene)
+    story_id = Database().save_story(story_data, generated_content)
+    prefetch_posters(len(generated_content.scenes))
+    return story_id
+
+
+job_queue = JobQueue(workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING)
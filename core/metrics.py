@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+METRICS_LOG = os.getenv('METRICS_LOG', 'false').lower() in ('1', 'true', 'yes')
+
+STAGE_SECONDS = "lovereel_stage_seconds"
+STAGE_ERRORS = "lovereel_stage_errors_total"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_HELP = {
+    STAGE_SECONDS: "Latency of each instrumented stage in seconds",
+    STAGE_ERRORS: "Stage executions that raised",
+    "lovereel_retries_total": "Retried upstream calls",
+    "lovereel_cache_requests_total": "Cache lookups by cache and result",
+    "lovereel_llm_tokens_total": "LLM tokens reported in response.usage",
+    "lovereel_llm_requests_total": "LLM requests that reported usage",
+    "lovereel_llm_request_seconds": "Latency of LLM requests that reported usage",
+}
+
+metrics_logger = logging.getLogger("lovereel.metrics")
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, bucket_count: int):
+        self.counts = [0] * bucket_count
+        self.sum = 0.0
+        self.count = 0
+
+
+class Registry:
+    """Thread-safe counters and fixed-bucket histograms keyed by name and labels"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(len(self.buckets) + 1)
+            histogram.counts[index] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> dict:
+        """Plain-dict view of every series, for reports and tests"""
+        with self._lock:
+            return {
+                "counters": {
+                    name: {_format_labels(k): v for k, v in series.items()}
+                    for name, series in self._counters.items()
+                },
+                "histograms": {
+                    name: {
+                        _format_labels(k): {"count": h.count, "sum": h.sum}
+                        for k, h in series.items()
+                    }
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            for name in sorted(self._histograms):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, histogram.counts):
+                        cumulative += count
+                        labels = _format_labels(key + (("le", _format_value(bound)),))
+                        lines.append(f"{name}_bucket{labels} {cumulative}")
+                    labels = _format_labels(key + (("le", "+Inf"),))
+                    lines.append(f"{name}_bucket{labels} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    escaped = (
+        f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in key
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+registry = Registry()
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _StageTimer:
+    __slots__ = ("stage", "labels", "start")
+
+    def __init__(self, stage: str, labels: Dict[str, str]):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        registry.observe(STAGE_SECONDS, elapsed, stage=self.stage, **self.labels)
+        if exc_type is not None:
+            registry.inc(STAGE_ERRORS, stage=self.stage, error=exc_type.__name__, **self.labels)
+        if METRICS_LOG:
+            metrics_logger.info(json.dumps({
+                "event": "stage",
+                "stage": self.stage,
+                "seconds": round(elapsed, 6),
+                "ok": exc_type is None,
+                **self.labels,
+            }))
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+def timer(stage: str, **labels: str):
+    """Context manager timing one stage; a shared no-op when metrics are disabled"""
+    if not METRICS_ENABLED:
+        return _NOOP_TIMER
+    return _StageTimer(stage, labels)
+
+
+def inc(name: str, amount: float = 1.0, **labels: str) -> None:
+    """Increment a counter when metrics are enabled"""
+    if METRICS_ENABLED:
+        registry.inc(name, amount, **labels)
+
+
+def record_usage(usage, model: str, provider: str = "", seconds: Optional[float] = None) -> None:
+    """Account one LLM request: prompt, cached and completion tokens and its latency"""
+    if not METRICS_ENABLED or usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    registry.inc("lovereel_llm_requests_total", model=model, provider=provider)
+    registry.inc("lovereel_llm_tokens_total", usage.prompt_tokens or 0, model=model, kind="prompt")
+    registry.inc("lovereel_llm_tokens_total", cached, model=model, kind="cached_prompt")
+    registry.inc("lovereel_llm_tokens_total", usage.completion_tokens or 0, model=model, kind="completion")
+    if seconds is not None:
+        registry.observe("lovereel_llm_request_seconds", seconds, model=model, provider=provider)
+    if METRICS_LOG:
+        metrics_logger.info(json.dumps({
+            "event": "llm_usage",
+            "model": model,
+            "provider": provider,
+            "prompt_tokens": usage.prompt_tokens,
+            "cached_tokens": cached,
+            "completion_tokens": usage.completion_tokens,
+            "seconds": None if seconds is None else round(seconds, 3),
+        }))
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server() -> None:
+    """Serve /metrics on METRICS_PORT once per process, if metrics are enabled"""
+    global _server
+    port = os.getenv('METRICS_PORT')
+    if not METRICS_ENABLED or not port or _server is not None:
+        return
+    with _server_lock:
+        if _server is not None:
+            return
+        try:
+            _server = ThreadingHTTPServer((os.getenv('METRICS_HOST', '0.0.0.0'), int(port)), _MetricsHandler)
+        except OSError as e:
+            logging.error(f"Could not start metrics server: {str(e)}")
+            return
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
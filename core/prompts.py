@@ -0,0 +1,143 @@
+import os
+import time
+import logging
+import threading
+from typing import List
+from models.schemas import StoryCreate
+from core import metrics
+
+# Scenes per story; RESPONSE_FORMAT in core.ai_client requires exactly this many.
+STORY_SCENES = 5
+
+# Upper bound on the user message. The creator's memories and answers are
+# trimmed, longest first, until the message fits.
+PROMPT_MAX_INPUT_TOKENS = int(os.getenv('PROMPT_MAX_INPUT_TOKENS', '1200'))
+# Token estimate used when tiktoken is not installed.
+CHARS_PER_TOKEN = 4
+# After a failed tokenizer load, prompts are counted by length for this long before retrying.
+TOKENIZER_RETRY_SECONDS = float(os.getenv('TOKENIZER_RETRY_SECONDS', '60'))
+
+# Everything that is the same for every request lives in the system message,
+# which is sent first. The repeated prefix (system message plus schema) is
+# then byte-identical across calls, so provider-side prompt caching can hit.
+SYSTEM_PROMPT = f"""You are a charming and witty romantic comedy screenwriter with expertise in both classic rom-coms and modern love stories. You specialize in blending real-life moments with fictional elements while maintaining warmth and authenticity.
+
+Key characteristics of your writing:
+- You seamlessly weave actual memories into larger narrative arcs
+- You create humor through situational comedy, not sarcasm or mockery
+- Your tone is playful and light-hearted, but never cynical
+- You respect the authenticity of real relationships while adding entertaining embellishments
+- You write inclusive, contemporary stories that avoid stereotypes and clichés
+
+When generating content:
+1. Treat the provided memories as anchor points for your story
+2. Use the personal facts to create natural quiz moments within scenes
+3. Add fictional elements that complement but don't overshadow real events
+4. Create plausible alternative options for quizzes that are funny without being ridiculous
+5. Write director's commentary in the style of a cheerful, romantic optimist
+
+Your goal is to celebrate the unique aspects of each relationship while creating an entertaining interactive experience. The story should feel like a personalized romantic comedy that captures both factual elements and the spirit of the couple's connection.
+
+Remember to:
+- Keep scenes concise but vivid
+- Balance humor with heart
+- Make quiz questions feel natural within the narrative
+- Create bloopers that are encouraging rather than embarrassing
+- Maintain consistent narrative voice throughout
+
+Each request gives you real memories and personal facts. Generate a romantic comedy story containing exactly {STORY_SCENES} scenes from them.
+
+USE the QUIZ, OPTIONS, or CORRECT_INDEX (ANSWERS) as needed to generate the content but DO NOT show them in the generated content EXCEPT for the actual QUIZ and OPTIONS.
+
+Format all output as valid JSON according to the specified schema."""
+
+STORY_PROMPT = """Real memories:
+{memories}
+
+Personal facts about me:
+{personal_facts}
+"""
+
+_encoding = None
+_encoding_retry_at = 0.0
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """tiktoken encoding for the default model, or None while it cannot be loaded.
+
+    The first load may download the vocabulary, so core.warmup calls this
+    before any job does. A failed load is retried after TOKENIZER_RETRY_SECONDS.
+    """
+    global _encoding, _encoding_retry_at
+    if _encoding is not None or time.monotonic() < _encoding_retry_at:
+        return _encoding
+    with _encoding_lock:
+        if _encoding is not None or time.monotonic() < _encoding_retry_at:
+            return _encoding
+        try:
+            import tiktoken
+            from core.providers import LLM_MODEL
+            try:
+                _encoding = tiktoken.encoding_for_model(LLM_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            # Not installed, or its vocabulary could not be downloaded.
+            logging.warning(f"Counting prompt tokens by length for now: {str(e)}")
+            _encoding_retry_at = time.monotonic() + TOKENIZER_RETRY_SECONDS
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+def truncate_tokens(text: str, limit: int) -> str:
+    """Cut text to at most limit tokens, marking the cut with an ellipsis"""
+    if count_tokens(text) <= limit:
+        return text
+    if limit <= 1:
+        return "…"
+    encoding = get_encoding()
+    if encoding is None:
+        cut = text[:(limit - 1) * CHARS_PER_TOKEN]
+    else:
+        cut = encoding.decode(encoding.encode(text)[:limit - 1])
+    return cut.rstrip() + "…"
+
+
+def fit_to_budget(texts: List[str], budget: int) -> List[str]:
+    """Trim the longest texts to a common cap so the total fits; shorter texts stay whole"""
+    counts = [count_tokens(t) for t in texts]
+    if sum(counts) <= budget:
+        return texts
+    remaining, left = budget, len(texts)
+    cap = 0
+    for count in sorted(counts):
+        share = remaining // left
+        if count > share:
+            cap = share
+            break
+        remaining -= count
+        left -= 1
+    return [t if c <= cap else truncate_tokens(t, cap) for t, c in zip(texts, counts)]
+
+
+def build_story_prompt(story_data: StoryCreate, max_tokens: int = PROMPT_MAX_INPUT_TOKENS) -> str:
+    """Fill the story prompt from the creator's memories and answers, within max_tokens"""
+    memories = [m.description for m in story_data.memories]
+    facts = [qa.answer for qa in story_data.personal_qa]
+    # Each line break joining the fields counts roughly one token.
+    overhead = count_tokens(STORY_PROMPT.format(memories="", personal_facts="")) + len(memories) + len(facts)
+    fitted = fit_to_budget(memories + facts, max(0, max_tokens - overhead))
+    if fitted != memories + facts:
+        metrics.inc("lovereel_prompt_truncated_total")
+        logging.info(f"Story prompt trimmed to {max_tokens} tokens")
+    return STORY_PROMPT.format(
+        memories="\n".join(fitted[:len(memories)]),
+        personal_facts="\n".join(fitted[len(memories):])
+    )
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+from openai import OpenAI
+from core.resilience import CircuitBreaker, CircuitOpenError
+from core import metrics
+
+LLM_MODEL = "gpt-4o-mini"
+
+# JSON list of OpenAI-compatible endpoints, e.g.
+# [{"name": "primary", "model": "gpt-4o-mini"},
+#  {"name": "backup", "model": "gpt-4o-mini", "base_url": "https://...", "api_key_env": "BACKUP_API_KEY"}]
+# Unset means a single provider from OPENAI_API_KEY / OPENAI_BASE_URL.
+LLM_PROVIDERS = os.getenv('LLM_PROVIDERS', '')
+LLM_HEDGE = os.getenv('LLM_HEDGE', 'false').lower() in ('1', 'true', 'yes')
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', '90'))
+LLM_ROUTING_PERCENTILE = float(os.getenv('LLM_ROUTING_PERCENTILE', '95'))
+LLM_LATENCY_MIN_SAMPLES = int(os.getenv('LLM_LATENCY_MIN_SAMPLES', '10'))
+LLM_LATENCY_WINDOW_SECONDS = float(os.getenv('LLM_LATENCY_WINDOW_SECONDS', '300'))
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv('LLM_BREAKER_RESET_SECONDS', '30'))
+
+# An attempt gets the provider and a claim() callback. It calls claim() as soon as the
+# provider starts answering (first stream chunk, or the full response) and must give up
+# if claim() returns False because another attempt answered first.
+Claim = Callable[[], bool]
+
+
+class LatencyWindow:
+    """Recent latency samples, bounded by count and age"""
+
+    def __init__(self, maxlen: int = 256, max_age: float = LLM_LATENCY_WINDOW_SECONDS):
+        self.max_age = max_age
+        self._samples: "deque[Tuple[float, float]]" = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append((time.monotonic(), seconds))
+
+    def percentile(self, pct: float, min_samples: int = LLM_LATENCY_MIN_SAMPLES) -> Optional[float]:
+        """Nearest-rank percentile, or None until there are enough fresh samples"""
+        cutoff = time.monotonic() - self.max_age
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            values = sorted(v for _, v in self._samples)
+        if not values or len(values) < min_samples:
+            return None
+        return values[min(len(values) - 1, int(pct / 100 * len(values)))]
+
+
+class Provider:
+    """One OpenAI-compatible endpoint and model with its own latency and health"""
+
+    def __init__(self, name: str, model: str, api_key: str, base_url: Optional[str] = None):
+        self.name = name
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+        self.client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.latency = {"sync": LatencyWindow(), "stream": LatencyWindow()}
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS, name=f"llm:{name}")
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    @property
+    def async_client(self):
+        """AsyncOpenAI client for this provider, created on first use"""
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    from openai import AsyncOpenAI
+                    self._async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        return self._async_client
+
+
+def load_providers() -> List[Provider]:
+    """Build providers from LLM_PROVIDERS, or the single default endpoint"""
+    specs = json.loads(LLM_PROVIDERS) if LLM_PROVIDERS.strip() else [{"name": "openai"}]
+    providers = []
+    for spec in specs:
+        key_env = spec.get("api_key_env", "OPENAI_API_KEY")
+        api_key = os.getenv(key_env)
+        if not api_key:
+            raise ValueError(f"{key_env} not found in environment variables")
+        providers.append(Provider(
+            name=spec.get("name", spec.get("model", LLM_MODEL)),
+            model=spec.get("model", LLM_MODEL),
+            api_key=api_key,
+            base_url=spec.get("base_url"),
+        ))
+    return providers
+
+
+class ProviderRouter:
+    """Picks providers by recent tail latency, fails over, and optionally hedges.
+
+    Providers are tried in order of their moving p95 (providers without enough
+    recent samples go first so they are measured). Providers whose circuit is
+    open are skipped, and a half-open provider gets a single trial call. With hedging on, the async path starts a second attempt
+    once the first has been silent for the primary's p90, and cancels the loser
+    as soon as either one starts answering.
+    """
+
+    def __init__(self, providers: List[Provider], hedge: bool = LLM_HEDGE):
+        self.providers = providers
+        self.hedge = hedge
+
+    def candidates(self, mode: str) -> List[Provider]:
+        """Available providers, fastest tail first"""
+        available = [p for p in self.providers if p.breaker.available()]
+        if not available:
+            raise CircuitOpenError("All LLM providers are failing; try again shortly")
+        return sorted(available, key=lambda p: p.latency[mode].percentile(LLM_ROUTING_PERCENTILE) or 0.0)
+
+    def hedge_delay(self, provider: Provider, mode: str) -> Optional[float]:
+        if not self.hedge:
+            return None
+        return provider.latency[mode].percentile(LLM_HEDGE_PERCENTILE)
+
+    def call(
+        self,
+        attempt: Callable[[Provider, Claim], Any],
+        retryable: Tuple[Type[BaseException], ...],
+        mode: str
+    ) -> Any:
+        """Run attempt on the best provider, failing over on retryable errors"""
+        last_error: Optional[BaseException] = None
+        for provider in self.candidates(mode):
+            if not provider.breaker.allow():
+                continue
+            start = time.monotonic()
+
+            def claim(provider=provider, start=start) -> bool:
+                provider.latency[mode].add(time.monotonic() - start)
+                return True
+
+            try:
+                result = attempt(provider, claim)
+            except retryable as e:
+                provider.breaker.record_failure()
+                last_error = e
+                logging.warning(f"LLM provider {provider.name} failed: {str(e)}")
+                continue
+            provider.breaker.record_success()
+            return result
+        if last_error is None:
+            raise CircuitOpenError("All LLM providers are failing; try again shortly")
+        raise last_error
+
+    async def acall(
+        self,
+        attempt: Callable[[Provider, Claim], Awaitable[Any]],
+        retryable: Tuple[Type[BaseException], ...],
+        mode: str,
+        may_hedge: Callable[[], bool] = lambda: True,
+        hedge_done: Callable[[], None] = lambda: None
+    ) -> Any:
+        """call() for coroutines, with hedging and loser cancellation.
+
+        may_hedge() is asked before each hedge and may reserve capacity for it;
+        hedge_done() is called as each hedge it allowed finishes, cancelled or not.
+        """
+        backups = self.candidates(mode)
+        tasks: Dict[asyncio.Future, Tuple[Provider, float]] = {}
+        hedges = set()
+        winner: Dict[str, Optional[asyncio.Future]] = {"task": None}
+
+        def next_backup() -> Optional[Provider]:
+            while backups:
+                provider = backups.pop(0)
+                if provider.breaker.allow():
+                    return provider
+            return None
+
+        def launch(provider: Provider, hedge: bool = False) -> None:
+            start = time.monotonic()
+            task: Optional[asyncio.Future] = None
+
+            def claim() -> bool:
+                if winner["task"] is not None:
+                    return False
+                winner["task"] = task
+                now = time.monotonic()
+                provider.latency[mode].add(now - start)
+                for other, (other_provider, other_start) in tasks.items():
+                    if other is not task and not other.done():
+                        # The loser took at least this long; count it so its tail reflects that.
+                        other_provider.latency[mode].add(now - other_start)
+                        other.cancel()
+                return True
+
+            task = asyncio.ensure_future(attempt(provider, claim))
+            tasks[task] = (provider, start)
+            if hedge:
+                hedges.add(task)
+                task.add_done_callback(lambda _: hedge_done())
+
+        primary = next_backup()
+        if primary is None:
+            raise CircuitOpenError("All LLM providers are failing; try again shortly")
+        launch(primary)
+        delay = self.hedge_delay(primary, mode)
+        hedge_at = None if delay is None else time.monotonic() + delay
+        last_error: Optional[BaseException] = None
+        try:
+            pending = set(tasks)
+            while pending:
+                timeout = None if hedge_at is None else max(0.0, hedge_at - time.monotonic())
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_at = None
+                    if winner["task"] is None and may_hedge():
+                        backup = next_backup() or primary
+                        metrics.inc("lovereel_llm_hedges_total", provider=backup.name)
+                        launch(backup, hedge=True)
+                        pending = {t for t in tasks if not t.done()}
+                    continue
+
+                for task in done:
+                    provider, _ = tasks[task]
+                    if task.cancelled():
+                        continue
+                    error = task.exception()
+                    if error is None:
+                        if task is winner["task"]:
+                            provider.breaker.record_success()
+                            if task in hedges:
+                                metrics.inc("lovereel_llm_hedge_wins_total", provider=provider.name)
+                            return task.result()
+                        continue
+                    if not isinstance(error, retryable):
+                        raise error
+                    provider.breaker.record_failure()
+                    logging.warning(f"LLM provider {provider.name} failed: {str(error)}")
+                    last_error = error
+                    if task is winner["task"]:
+                        winner["task"] = None
+
+                if not pending:
+                    backup = next_backup()
+                    if backup is not None:
+                        hedge_at = None
+                        launch(backup)
+                        pending = {t for t in tasks if not t.done()}
+            if last_error is None:
+                raise RuntimeError("No LLM provider produced a response")
+            raise last_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+
+_router: Optional[ProviderRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ProviderRouter:
+    """Process-wide router, so latency and health are shared by every session"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ProviderRouter(load_providers())
+    return _router
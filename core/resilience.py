@@ -0,0 +1,309 @@
+import random
+import asyncio
+import threading
+import time
+import logging
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, Tuple, Type, TypeVar
+from core import metrics
+from core.cache import TTLCache
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request cannot complete before its deadline"""
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when every upstream is failing and calls are being shed"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket; shared instances rate-limit the whole process"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens without waiting"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0, deadline: Optional[float] = None) -> bool:
+        """Wait for tokens; returns False if they cannot be had before the deadline"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+    async def acquire_async(self, tokens: float = 1.0, deadline: Optional[float] = None) -> bool:
+        """acquire() for coroutines: waits with asyncio.sleep instead of blocking"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+
+class AsyncSlots:
+    """Concurrency limit for coroutines on one event loop.
+
+    Like asyncio.Semaphore, but try_acquire() takes a slot without waiting,
+    for optional work that should only start when there is room. Waiters are
+    served in arrival order and try_acquire() never overtakes them.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._used = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+
+    def try_acquire(self) -> bool:
+        if self._used >= self.limit or self._waiters:
+            return False
+        self._used += 1
+        return True
+
+    async def acquire(self, deadline: Optional[float] = None) -> bool:
+        """Wait for a slot; returns False if none frees up before the deadline"""
+        if self.try_acquire():
+            return True
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            return True
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over as the wait ended; pass it on.
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return False
+
+    def release(self) -> None:
+        """Free a slot, handing it straight to the longest waiter if there is one"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._used -= 1
+
+
+class KeyedRateLimiter:
+    """One token bucket per key (for example a client address), forgetting idle keys"""
+
+    def __init__(self, rate: float, capacity: float, maxsize: int = 10000, name: str = "keyed"):
+        self.rate = rate
+        self.capacity = capacity
+        self.name = name
+        # A bucket idle this long has refilled completely, so dropping it changes nothing.
+        self._buckets = TTLCache(name=f"{name}_buckets", maxsize=maxsize, ttl=max(1.0, capacity / rate))
+        self._lock = threading.Lock()
+
+    def allow(self, key: str) -> bool:
+        """Take one token for key without waiting"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.capacity)
+            self._buckets.set(key, bucket)
+        allowed = bucket.try_acquire()
+        if not allowed:
+            metrics.inc("lovereel_throttled_total", limiter=self.name)
+        return allowed
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read Retry-After (or retry-after-ms) from an API error's response, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_ms = headers.get("retry-after-ms")
+    if retry_ms:
+        try:
+            return float(retry_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_retries(
+    fn: Callable[[float], T],
+    retryable: Tuple[Type[BaseException], ...],
+    deadline: float,
+    max_attempts: int = 4,
+    base_delay: float = 0.5,
+    max_delay: float = 20.0,
+    operation: str = "call",
+) -> T:
+    """Call fn(remaining_seconds) with capped exponential backoff and full jitter.
+
+    A server-provided Retry-After takes precedence over the computed delay. No
+    attempt is started, and no sleep is taken, past the deadline.
+    """
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("Request deadline exceeded")
+        try:
+            return fn(remaining)
+        except retryable as e:
+            attempt += 1
+            if attempt >= max_attempts:
+                raise
+            delay = _next_delay(e, attempt, base_delay, max_delay)
+            if time.monotonic() + delay >= deadline:
+                raise
+            metrics.inc("lovereel_retries_total", operation=operation, error=type(e).__name__)
+            logging.warning(f"Retrying after {type(e).__name__} in {delay:.2f}s (attempt {attempt})")
+            time.sleep(delay)
+
+
+def _next_delay(error: BaseException, attempt: int, base_delay: float, max_delay: float) -> float:
+    delay = retry_after_seconds(error)
+    if delay is None:
+        delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+    return delay
+
+
+async def async_call_with_retries(
+    fn: Callable[[float], Awaitable[T]],
+    retryable: Tuple[Type[BaseException], ...],
+    deadline: float,
+    max_attempts: int = 4,
+    base_delay: float = 0.5,
+    max_delay: float = 20.0,
+    operation: str = "call",
+) -> T:
+    """call_with_retries for coroutine functions"""
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("Request deadline exceeded")
+        try:
+            return await fn(remaining)
+        except retryable as e:
+            attempt += 1
+            if attempt >= max_attempts:
+                raise
+            delay = _next_delay(e, attempt, base_delay, max_delay)
+            if time.monotonic() + delay >= deadline:
+                raise
+            metrics.inc("lovereel_retries_total", operation=operation, error=type(e).__name__)
+            logging.warning(f"Retrying after {type(e).__name__} in {delay:.2f}s (attempt {attempt})")
+            await asyncio.sleep(delay)
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; lets one trial call through after reset_timeout.
+
+    While half-open, allow() hands out a single probe. Its outcome closes or
+    re-opens the circuit; a probe that never reports back frees the slot
+    again after another reset_timeout.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, name: str = "circuit"):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_until: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _probe_free(self, now: float) -> bool:
+        return (
+            now - self._opened_at >= self.reset_timeout
+            and (self._probe_until is None or now >= self._probe_until)
+        )
+
+    def available(self) -> bool:
+        """Closed, or half-open with the trial call not yet taken; does not take it"""
+        with self._lock:
+            return self._opened_at is None or self._probe_free(time.monotonic())
+
+    def allow(self) -> bool:
+        """available(), and when half-open also take the single trial call"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if not self._probe_free(now):
+                return False
+            self._probe_until = now + self.reset_timeout
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_until = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            half_open = self._opened_at is not None
+            if half_open or self._failures >= self.failure_threshold:
+                if not half_open:
+                    metrics.inc("lovereel_circuit_open_total", circuit=self.name)
+                    logging.warning(f"Circuit {self.name} opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+                self._probe_until = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
@@ -0,0 +1,277 @@
+import os
+import atexit
+import logging
+import tempfile
+import threading
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Sequence
+from bson import json_util
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from core.database import RESULTS_COLLECTION, STORY_STATS_COLLECTION, get_client
+from core import metrics
+
+RESULTS_BATCH_SIZE = int(os.getenv('RESULTS_BATCH_SIZE', '100'))
+RESULTS_FLUSH_SECONDS = float(os.getenv('RESULTS_FLUSH_SECONDS', '5'))
+# Events held in memory while Mongo is slow or down; beyond this they go to the spill file.
+RESULTS_MAX_BUFFER = int(os.getenv('RESULTS_MAX_BUFFER', '10000'))
+# Empty disables spilling: overflow is dropped and counted instead.
+RESULTS_SPILL_PATH = os.getenv(
+    'RESULTS_SPILL_PATH',
+    os.path.join(tempfile.gettempdir(), "lovereel_results_spill.jsonl")
+)
+DUPLICATE_KEY = 11000
+
+
+class ResultRecorder:
+    """Write-behind buffer for quiz results.
+
+    record() only appends to memory. A flusher thread writes the buffer every
+    batch_size events or flush_interval seconds: raw events with one
+    insert_many, and per-story stats with one bulk of $inc upserts, so the
+    stats never need a scan. Events that fail to write, and events beyond
+    max_buffer, are appended to a local spill file that is replayed by the
+    next flush. Whatever is left is flushed at interpreter exit.
+
+    Replays are idempotent: every event carries its own _id, so an insert
+    that already landed fails with a duplicate key and is not folded into
+    the stats again, and an event whose insert landed but whose stats did
+    not is spilled marked "inserted" so only its stats are retried.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        flush_interval: float,
+        max_buffer: int,
+        spill_path: Optional[str],
+        client=None
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.spill_path = spill_path or None
+        self._client = client
+        self._buffer: Deque[Dict] = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    @property
+    def db(self):
+        return (self._client or get_client())[os.getenv('DB_NAME')]
+
+    def record(
+        self,
+        story_id: str,
+        answers: Sequence[int],
+        answer_key: Sequence[int],
+        seconds: Optional[float] = None
+    ) -> None:
+        """Queue one completed quiz; never touches Mongo"""
+        correct = [a == k for a, k in zip(answers, answer_key)]
+        event = {
+            "_id": ObjectId(),
+            "story_id": ObjectId(story_id),
+            "answers": list(answers),
+            "correct": correct,
+            "score": sum(correct),
+            "total": len(answer_key),
+            "seconds": seconds,
+            "created_at": datetime.now(timezone.utc),
+        }
+        overflow: List[Dict] = []
+        with self._lock:
+            self._buffer.append(event)
+            while len(self._buffer) > self.max_buffer:
+                overflow.append(self._buffer.popleft())
+            full = len(self._buffer) >= self.batch_size
+        if overflow:
+            self._spill(overflow)
+        self._start()
+        if full:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Write spilled and buffered events; returns how many were written"""
+        with self._flush_lock:
+            written = 0
+            spilled = self._take_spill()
+            if spilled and not self._write(spilled):
+                return 0
+            written += len(spilled)
+            while True:
+                with self._lock:
+                    batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                if not batch:
+                    return written
+                if not self._write(batch):
+                    return written
+                written += len(batch)
+
+    def close(self) -> None:
+        """Stop the flusher and write what is left"""
+        self._stop.set()
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval)
+        self.flush()
+
+    def _start(self) -> None:
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._run, name="results-flusher", daemon=True)
+            self._flusher.start()
+        atexit.register(self.close)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Results flush failed: {str(e)}")
+
+    def _write(self, events: List[Dict]) -> bool:
+        """Insert events and fold the inserted ones into story stats; failures are spilled"""
+        with metrics.timer("results_flush"):
+            fresh = [e for e in events if not e.get("inserted")]
+            to_fold = [e for e in events if e.get("inserted")]
+            failed = self._insert(fresh, to_fold)
+            failed.extend(self._fold(to_fold))
+        if failed:
+            self._spill(failed)
+            return False
+        metrics.inc("lovereel_results_written_total", len(events))
+        return True
+
+    def _insert(self, events: List[Dict], inserted: List[Dict]) -> List[Dict]:
+        """insert_many; appends what landed to inserted and returns what did not"""
+        if not events:
+            return []
+        try:
+            self.db[RESULTS_COLLECTION].insert_many([_document(e) for e in events], ordered=False)
+        except BulkWriteError as e:
+            codes = {err["index"]: err.get("code") for err in e.details.get("writeErrors", [])}
+            failed = []
+            for i, event in enumerate(events):
+                code = codes.get(i)
+                if code is None:
+                    inserted.append(event)
+                elif code != DUPLICATE_KEY:
+                    failed.append(event)
+                # A duplicate landed in an earlier attempt whose outcome was unknown;
+                # it is not folded again so a replay can never count it twice.
+            if failed:
+                logging.error(f"Failed to insert {len(failed)} quiz results: {str(e)}")
+            return failed
+        except PyMongoError as e:
+            logging.error(f"Failed to insert {len(events)} quiz results: {str(e)}")
+            return events
+        inserted.extend(events)
+        return []
+
+    def _fold(self, events: List[Dict]) -> List[Dict]:
+        """Apply stats for inserted events; returns those whose story update failed, marked inserted"""
+        if not events:
+            return []
+        story_ids = list(dict.fromkeys(e["story_id"] for e in events))
+        try:
+            self.db[STORY_STATS_COLLECTION].bulk_write(stats_updates(events), ordered=False)
+            return []
+        except BulkWriteError as e:
+            failed_stories = {story_ids[err["index"]] for err in e.details.get("writeErrors", [])}
+            error = e
+        except PyMongoError as e:
+            failed_stories = set(story_ids)
+            error = e
+        failed = [dict(e, inserted=True) for e in events if e["story_id"] in failed_stories]
+        logging.error(f"Failed to update stats for {len(failed)} quiz results: {str(error)}")
+        return failed
+
+    def _spill(self, events: List[Dict]) -> None:
+        if not self.spill_path:
+            metrics.inc("lovereel_results_dropped_total", len(events))
+            logging.error(f"Dropped {len(events)} quiz results")
+            return
+        try:
+            with open(self.spill_path, "a") as f:
+                for event in events:
+                    f.write(json_util.dumps(event) + "\n")
+            metrics.inc("lovereel_results_spilled_total", len(events))
+        except OSError as e:
+            metrics.inc("lovereel_results_dropped_total", len(events))
+            logging.error(f"Dropped {len(events)} quiz results, spill failed: {str(e)}")
+
+    def _take_spill(self) -> List[Dict]:
+        """Read and remove the spill file; a failed write spills the events again"""
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return []
+        # Unique per taker: several processes on a host may share one spill path.
+        taken = f"{self.spill_path}.{os.getpid()}.{uuid.uuid4().hex}.replay"
+        try:
+            os.replace(self.spill_path, taken)
+            with open(taken) as f:
+                events = [json_util.loads(line) for line in f if line.strip()]
+            os.remove(taken)
+        except (OSError, ValueError) as e:
+            logging.error(f"Failed to read spilled quiz results: {str(e)}")
+            return []
+        return events
+
+
+def _document(event: Dict) -> Dict:
+    return {k: v for k, v in event.items() if k != "inserted"}
+
+
+def stats_updates(events: List[Dict]) -> List[UpdateOne]:
+    """One $inc upsert per story covering every event for it in the batch, in first-seen order"""
+    per_story: Dict[ObjectId, Dict] = {}
+    last_played: Dict[ObjectId, datetime] = {}
+    for event in events:
+        inc = per_story.setdefault(event["story_id"], {})
+
+        def add(field: str, amount: float = 1) -> None:
+            inc[field] = inc.get(field, 0) + amount
+
+        add("plays")
+        add("score_sum", event["score"])
+        add(f"scores.{event['score']}")
+        if event["score"] == event["total"]:
+            add("perfect")
+        if event.get("seconds") is not None:
+            add("timed_plays")
+            add("seconds_sum", event["seconds"])
+        for i, (answer, correct) in enumerate(zip(event["answers"], event["correct"])):
+            add(f"questions.{i}.answers.{answer}")
+            if correct:
+                add(f"questions.{i}.correct")
+        played_at = event["created_at"]
+        if event["story_id"] not in last_played or played_at > last_played[event["story_id"]]:
+            last_played[event["story_id"]] = played_at
+
+    return [
+        UpdateOne(
+            {"_id": story_id},
+            {"$inc": inc, "$set": {"last_played_at": last_played[story_id]}},
+            upsert=True
+        )
+        for story_id, inc in per_story.items()
+    ]
+
+
+result_recorder = ResultRecorder(
+    batch_size=RESULTS_BATCH_SIZE,
+    flush_interval=RESULTS_FLUSH_SECONDS,
+    max_buffer=RESULTS_MAX_BUFFER,
+    spill_path=RESULTS_SPILL_PATH,
+)
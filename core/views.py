@@ -0,0 +1,91 @@
+import re
+from typing import Dict, NamedTuple, Optional, Tuple
+from models.schemas import GeneratedContent
+
+# Version of the compact "story" encoding; documents with another version
+# (or the older "content"/"view" fields) are re-encoded on first read.
+STORY_ENCODING_VERSION = 2
+
+# Characters Streamlit's markdown would otherwise interpret ($ starts LaTeX).
+_MARKDOWN_SPECIAL = re.compile(r"([\\`*_{}\[\]()#+\-.!|<>~$:])")
+_ESCAPED = re.compile(r"\\(.)", re.DOTALL)
+
+
+def escape_markdown(text: str) -> str:
+    """Backslash-escape text so st.markdown shows it literally"""
+    return _MARKDOWN_SPECIAL.sub(r"\\\1", text or "")
+
+
+def unescape_markdown(text: str) -> str:
+    """Exact inverse of escape_markdown"""
+    return _ESCAPED.sub(r"\1", text or "")
+
+
+def encode_story(content: GeneratedContent) -> Dict:
+    """Compact stored form of validated content.
+
+    Prose is stored once, already escaped for markdown, under short keys:
+    t title, sc scenes (b body, q question, o options, a answer index,
+    n director's note, x matching blooper) and bx bloopers beyond the last
+    scene. Scene numbers are positional and not stored.
+    """
+    bloopers = content.bloopers
+    scenes = []
+    for i, scene in enumerate(content.scenes):
+        scenes.append({
+            "b": escape_markdown(scene.content),
+            "q": escape_markdown(scene.quiz.question),
+            "o": [escape_markdown(option) for option in scene.quiz.options],
+            "a": scene.quiz.correct_index,
+            "n": escape_markdown(scene.commentary),
+            "x": escape_markdown(bloopers[i]) if i < len(bloopers) else None,
+        })
+    encoded = {"v": STORY_ENCODING_VERSION, "t": escape_markdown(content.title), "sc": scenes}
+    if len(bloopers) > len(scenes):
+        encoded["bx"] = [escape_markdown(b) for b in bloopers[len(scenes):]]
+    return encoded
+
+
+def is_current(encoded: Optional[Dict]) -> bool:
+    return bool(encoded) and encoded.get("v") == STORY_ENCODING_VERSION
+
+
+class SceneView(NamedTuple):
+    heading: str
+    body: str
+    question: str
+    options: Tuple[str, ...]
+    answer: int
+    note: str
+    blooper: str
+
+
+class RecipientView(NamedTuple):
+    """Everything the recipient page renders, as markdown, in attribute form"""
+    title: str
+    title_md: str
+    scenes: Tuple[SceneView, ...]
+    answer_key: Tuple[int, ...]
+
+
+def decode_view(encoded: Dict) -> RecipientView:
+    """Build the recipient view straight from the stored encoding"""
+    scenes = tuple(
+        SceneView(
+            heading=f"## Scene {i}",
+            body=s["b"],
+            question=s["q"],
+            options=tuple(s["o"]),
+            answer=s["a"],
+            note=f"**Director's Note:** {s['n']}",
+            blooper=f"🎬 Scene {i}: {s['x'] if s['x'] is not None else 'No blooper available'}",
+        )
+        for i, s in enumerate(encoded["sc"], start=1)
+    )
+    return RecipientView(
+        title=unescape_markdown(encoded["t"]),
+        title_md=encoded["t"],
+        scenes=scenes,
+        answer_key=tuple(s.answer for s in scenes),
+    )
+
@@ -0,0 +1,113 @@
+"""Get a fresh process ready before its first requests.
+
+app.py starts these steps on a background thread on the first page load.
+They open the Mongo pool, create the indexes, load the prompt tokenizer,
+recover abandoned jobs, load the LLM and poster client code and create their shared clients. Running
+the module does the same in the foreground and prints each step's time,
+for use as a container start or readiness command:
+
+    python -m core.warmup
+"""
+from dotenv import load_dotenv
+
+if __name__ == "__main__":
+    # Run as a command: read .env before the imports below read their settings.
+    load_dotenv()
+
+import sys
+import json
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from core.database import check_health, ensure_indexes
+from core import metrics
+from core import aio
+
+
+def _warm_mongo() -> None:
+    if not check_health():
+        raise RuntimeError("MongoDB is unreachable")
+    ensure_indexes()
+
+
+def _warm_tokenizer() -> None:
+    # The first load of the vocabulary may download it.
+    from core.prompts import get_encoding
+    if get_encoding() is None:
+        raise RuntimeError("tiktoken is unavailable; prompts are counted by length")
+
+
+def _recover_jobs() -> None:
+    from core.jobs import job_queue
+    job_queue.recover()
+
+
+def _warm_llm() -> None:
+    # The import loads openai; the router builds one client per provider.
+    import core.ai_client  # noqa: F401
+    from core.providers import get_router
+    get_router()
+
+
+def _warm_posters() -> None:
+    from utils.helpers import warm_clients
+    warm_clients()
+
+
+def _warm_async() -> None:
+    if not aio.use_async():
+        return
+    aio.get_loop()
+    aio.get_async_mongo()
+    aio.get_async_openai()
+    aio.get_async_http()
+
+
+STEPS: List[Tuple[str, Callable[[], None]]] = [
+    ("mongo", _warm_mongo),
+    # Before recovered jobs start building prompts.
+    ("tokenizer", _warm_tokenizer),
+    ("jobs", _recover_jobs),
+    ("llm", _warm_llm),
+    ("posters", _warm_posters),
+    ("async", _warm_async),
+]
+
+_thread: Optional[threading.Thread] = None
+_thread_lock = threading.Lock()
+
+
+def warmup() -> Dict[str, float]:
+    """Run every step, returning seconds per step; failures are logged, not raised"""
+    timings = {}
+    for name, step in STEPS:
+        start = time.perf_counter()
+        try:
+            with metrics.timer("warmup", step=name):
+                step()
+        except Exception as e:
+            logging.error(f"Warmup step {name} failed: {str(e)}")
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def start_warmup() -> None:
+    """Run warmup() once per process on a background thread"""
+    global _thread
+    if _thread is not None:
+        return
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=warmup, name="warmup", daemon=True)
+            _thread.start()
+
+
+def main() -> int:
+    timings = warmup()
+    print(json.dumps({name: round(seconds, 4) for name, seconds in timings.items()}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,20 @@
 import os
 import streamlit as st
-from core.database import Database
-from core.ai_client import DeepSeekClient
+from core.idempotency import payload_key
+from core.jobs import DONE, FAILED, QUEUED, QueueFull, job_queue
 from models.schemas import StoryCreate, Memory, QAPair
 from utils.helpers import format_shareable_link
 import traceback
+import uuid
 import logging
 
 logging.basicConfig(level=logging.INFO)
 
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '1'))
+# Carries the job id in the URL so a reloaded page picks the job up again.
+JOB_QUERY_PARAM = "job"
 
 
-STORY_PROMPT = """Generate a romantic comedy story containing exactly 3 scenes using these real memories:
-{memories}
-
-And these personal facts about me:
-{personal_facts}
-
-Format as valid JSON according to the specified schema.
-
-USE the QUIZ, OPTIONS, or CORRECT_INDEX (ANSWERS) as needed to generate the content but DO NOT show them in the generated content EXCEPT for the actual QUIZ and OPTIONS.
-"""
-        
 def creator_flow():
     try:
         st.title("Create Your ❤️ Story Quiz")
@@ -29,11 +22,14 @@ def creator_flow():
         if 'current_step' not in st.session_state:
             st.session_state.current_step = 0
             st.session_state.story_data = {"memories": [], "personal_qa": []}
+        _resume_job()
 
         if st.session_state.current_step == 0:
             _handle_memory_step()
         elif st.session_state.current_step == 1:
             _handle_question_step()
+
+        _show_generation()
             
     except Exception as e:
         _handle_error(e)
@@ -92,6 +88,7 @@ def _handle_question_step():
     
     if st.button("Generate Story"):
         if all(q["question"] and q["answer"] for q in qa_data):
+            st.session_state.story_data["personal_qa"] = qa_data
             try:
                 memories = [
                     Memory(**m) for m in st.session_state.story_data["memories"]
@@ -113,31 +110,75 @@ def _handle_question_step():
 
 
 def _generate_content(story_data: StoryCreate):
-    """Handle story generation process"""
+    """Queue story generation; the job view below the form polls it"""
     try:
-        with st.spinner("Creating your romantic comedy..."):
-            prompt = STORY_PROMPT.format(
-                memories="\n".join([m.description for m in story_data.memories]),
-                personal_facts="\n".join([qa.answer for qa in story_data.personal_qa])
-            )
-            
-            ai_client = DeepSeekClient()
-            db = Database()
-            
-            generated_content = ai_client.generate_story_content(prompt)
-            story_id = db.save_story(story_data, generated_content)
-            
-            st.session_state.generated_story_id = story_id
-            link = format_shareable_link(story_id)
-            st.success("✨ Story created! Share this link with your loved one:")
-            st.code(link)
-            
-    except Exception as e:
-        _handle_error(e)
-        st.error("We encountered an issue creating your story. Please try again.")
-        st.session_state.current_step = 0
+        request_key = payload_key(story_data, _session_key())
+        st.session_state.job_id = job_queue.submit(story_data, request_key)
+        st.query_params[JOB_QUERY_PARAM] = st.session_state.job_id
+        st.session_state.pop("generated_story_id", None)
+        st.session_state.pop("job_failed", None)
+    except QueueFull as e:
+        logging.error(f"Story generation unavailable: {str(e)}")
+        st.session_state.job_failed = "busy"
+
+def _resume_job():
+    """Pick up the job named in the URL when this session has none, e.g. after a reload"""
+    job_id = st.query_params.get(JOB_QUERY_PARAM)
+    if not job_id or "job_id" in st.session_state:
+        return
+    if st.session_state.get("generated_story_id") or st.session_state.get("job_failed"):
+        return
+    st.session_state.job_id = job_id
+
+def _show_generation():
+    """Whatever the latest generation job has to show"""
+    if "job_id" in st.session_state:
+        _job_status()
+    elif st.session_state.get("generated_story_id"):
+        link = format_shareable_link(st.session_state.generated_story_id)
+        st.success("✨ Story created! Share this link with your loved one:")
+        st.code(link)
+    elif st.session_state.get("job_failed") == "busy":
+        st.warning("💌 Our storytellers are busy right now. Your answers are saved, please press Generate Story again in a moment.")
+    elif st.session_state.get("job_failed"):
+        st.error("We encountered an issue creating your story. Your answers are saved, please try again.")
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def _job_status():
+    """Poll the job record; once it settles, rerun the page to show the outcome"""
+    job = job_queue.get(st.session_state.get("job_id", ""))
+    if job is None or job["state"] in (DONE, FAILED):
+        st.session_state.pop("job_id", None)
+        if job is None:
+            st.session_state.job_failed = "error"
+        elif job["state"] == DONE:
+            st.session_state.generated_story_id = job["story_id"]
+        else:
+            st.session_state.job_failed = "busy" if job.get("transient") else "error"
+        if job is None or job["state"] == FAILED:
+            # A reload should offer a fresh start rather than the same failure.
+            st.query_params.pop(JOB_QUERY_PARAM, None)
         st.rerun()
 
+    if job["state"] == QUEUED:
+        st.info("💌 Your story is in line, it will start in a moment...")
+        return
+    with st.spinner("Creating your romantic comedy..."):
+        for scene in job.get("scenes", []):
+            _preview_scene(st.container(), scene)
+
+def _session_key() -> str:
+    """Stable per-session scope for deduplicating submissions"""
+    if "session_key" not in st.session_state:
+        st.session_state.session_key = uuid.uuid4().hex
+    return st.session_state.session_key
+
+def _preview_scene(container, scene: dict):
+    """Show a scene as soon as it has streamed in"""
+    with container:
+        st.markdown(f"#### 🎬 Scene {scene.get('scene_number', '')}")
+        st.write(scene.get("content", ""))
+
 def _handle_error(error: Exception) -> None:
     """Log errors while showing user-friendly message"""
     logging.error(f"Error: {str(error)}")
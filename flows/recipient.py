@@ -1,17 +1,44 @@
+import os
+import time
+import asyncio
 import streamlit as st
-from core.database import Database
-from utils.helpers import format_shareable_link, generate_temp_poster
-from typing import Dict
+from bson.objectid import ObjectId
+from core.database import Database, AsyncDatabase
+from utils.helpers import format_shareable_link, generate_temp_poster, apreload_posters
+from core import metrics
+from core import aio
+from core.resilience import KeyedRateLimiter
+from core.results import result_recorder
+from utils.assets import asset_store
+from core.views import RecipientView, SceneView
+from core.prompts import STORY_SCENES
+from typing import Optional
 import traceback
 import logging
 
 logging.basicConfig(level=logging.INFO)
 
+# Story lookups that reach Mongo, per client address; link scanners hit this long
+# before Mongo notices. Stories already in memory are never throttled.
+_lookup_limiter = KeyedRateLimiter(
+    rate=float(os.getenv('LOOKUP_RATE_PER_SECOND', '0.5')),
+    capacity=float(os.getenv('LOOKUP_BURST', '20')),
+    name="story_lookup",
+)
+# Reverse proxies in front of the app that append to X-Forwarded-For. The client
+# is the address the outermost of them added, counted from the right; entries to
+# its left come from the client and are ignored.
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+_undeclared_proxy_logged = False
+
 
 def recipient_flow(story_id: str):
+    if not ObjectId.is_valid(story_id):
+        st.error("📭 Story not found! Please check the link and try again.")
+        return
     try:
         _initialize_session_state()
-        story_data = _get_story_data(story_id)
+        story_data = _get_session_story(story_id)
         
         if story_data:
             _display_story_header(story_data)
@@ -25,13 +52,30 @@ def _initialize_session_state():
     if 'quiz_submitted' not in st.session_state:
         st.session_state.quiz_submitted = False
         st.session_state.user_answers = []
-        st.session_state.correct_answers = []
 
-def _get_story_data(story_id: str) -> Dict:
+def _get_session_story(story_id: str) -> Optional[RecipientView]:
+    """Load the story once per session; later reruns reuse the session copy"""
+    if st.session_state.get("recipient_story_id") != story_id:
+        story_data = _get_story_data(story_id)
+        if not story_data:
+            return None
+        st.session_state.recipient_story_id = story_id
+        st.session_state.recipient_story = story_data
+        st.session_state.quiz_started_at = time.time()
+    return st.session_state.recipient_story
+
+def _get_story_data(story_id: str) -> Optional[RecipientView]:
     """Retrieve story data from database"""
+    client = _client_key()
+    if client is not None and not Database.is_cached(story_id) and not _lookup_limiter.allow(client):
+        st.warning("🐢 Too many story lookups from your connection. Please wait a moment and try again.")
+        return None
     try:
-        db = Database()
-        story_data = db.get_story(story_id)
+        with metrics.timer("flow_load_story"):
+            if aio.use_async():
+                story_data = aio.run_sync(_aload_story(story_id))
+            else:
+                story_data = Database().get_recipient_story(story_id)
         
         if not story_data:
             st.error("📭 Story not found! Please check the link and try again.")
@@ -44,27 +88,66 @@ def _get_story_data(story_id: str) -> Dict:
         st.error("📚 We're having trouble accessing this story. Please try again later.")
         return None
 
-def _display_story_header(story_data: Dict):
+def _client_key() -> Optional[str]:
+    """Client address for throttling; None when it is unknown, so clients never share a bucket"""
+    return client_address(st.context.headers.get("X-Forwarded-For"), st.context.ip_address, TRUSTED_PROXY_HOPS)
+
+def client_address(forwarded: Optional[str], peer: Optional[str], hops: int) -> Optional[str]:
+    """The address the outermost trusted proxy saw, or the peer when there are no proxies"""
+    if hops <= 0:
+        if forwarded:
+            # The peer is a proxy nobody declared; keying on it would put
+            # every client in one bucket, so these requests are not throttled.
+            global _undeclared_proxy_logged
+            if not _undeclared_proxy_logged:
+                _undeclared_proxy_logged = True
+                logging.warning("Requests arrive through a proxy; set TRUSTED_PROXY_HOPS to throttle story lookups")
+            return None
+        return peer if isinstance(peer, str) and peer else None
+    entries = [e.strip() for e in (forwarded or "").split(",") if e.strip()]
+    if len(entries) < hops:
+        return None
+    return entries[-hops]
+
+async def _aload_story(story_id: str) -> Optional[RecipientView]:
+    """Fetch the story while the result posters are loaded into memory"""
+    story_data, preload = await asyncio.gather(
+        AsyncDatabase().get_recipient_story(story_id),
+        apreload_posters(STORY_SCENES),
+        return_exceptions=True
+    )
+    if isinstance(preload, Exception):
+        logging.error(f"Poster preload failed: {str(preload)}")
+    if isinstance(story_data, Exception):
+        raise story_data
+    return story_data
+
+def _display_story_header(story_data: RecipientView):
     """Display story title and header"""
-    st.title(story_data["content"]["title"])
+    st.title(story_data.title_md)
     st.subheader("A Romantic Comedy About Your ❤️ Story")
     st.markdown("---")
 
-def _handle_quiz_flow(story_data: Dict):
+def _handle_quiz_flow(story_data: RecipientView):
     """Handle the quiz flow and results display"""
     if not st.session_state.quiz_submitted:
         _display_quiz(story_data)
     else:
         _display_results(story_data)
 
-def _display_quiz(story_data: Dict):
-    """Display quiz questions and collect answers"""
+def _display_quiz(story_data: RecipientView):
+    """Display quiz questions inside a form so answering does not rerun the page"""
     try:
-        for i, scene in enumerate(story_data["content"]["scenes"]):
-            _display_scene(i, scene)
+        scenes = story_data.scenes
+        with st.form("quiz"):
+            for i, scene in enumerate(scenes):
+                _display_scene(i, scene)
+            submitted = st.form_submit_button("🎬 Submit Answers")
             
-        if st.button("🎬 Submit Answers"):
+        if submitted:
+            st.session_state.user_answers = [st.session_state[f"quiz_{i}"] for i in range(len(scenes))]
             st.session_state.quiz_submitted = True
+            _record_result(story_data)
             st.rerun()
             
     except Exception as e:
@@ -72,41 +155,54 @@ def _display_quiz(story_data: Dict):
         st.session_state.quiz_submitted = False
         st.rerun()
 
-def _display_scene(index: int, scene: Dict):
-    """Display individual scene and quiz"""
-    st.markdown(f"## Scene {index + 1}")
-    st.write(scene["content"])
-    
-    if index >= len(st.session_state.correct_answers):
-        st.session_state.correct_answers.append(scene["quiz"]["correct_index"])
+def _record_result(story_data: RecipientView):
+    """Hand the submitted answers to the write-behind recorder"""
+    try:
+        started_at = st.session_state.get("quiz_started_at")
+        result_recorder.record(
+            st.session_state.recipient_story_id,
+            st.session_state.user_answers,
+            story_data.answer_key,
+            seconds=None if started_at is None else time.time() - started_at,
+        )
+    except Exception as e:
+        logging.error(f"Failed to record quiz result: {str(e)}")
+
+def _display_scene(index: int, scene: SceneView):
+    """Display individual scene and quiz; the answer is stored as an option index"""
+    st.markdown(scene.heading)
+    st.markdown(scene.body)
     
-    answer = st.radio(
-        scene["quiz"]["question"],
-        options=scene["quiz"]["options"],
+    options = scene.options
+    st.radio(
+        scene.question,
+        options=range(len(options)),
+        format_func=options.__getitem__,
         key=f"quiz_{index}"
     )
     
-    if index >= len(st.session_state.user_answers):
-        st.session_state.user_answers.append(answer)
-    else:
-        st.session_state.user_answers[index] = answer
-    
-    st.caption(f"**Director's Note:** {scene['commentary']}")
+    st.caption(scene.note)
     st.markdown("---")
 
-def _display_results(story_data: Dict):
+def _display_results(story_data: RecipientView):
     """Display quiz results and bloopers"""
     try:
+        total = len(story_data.scenes)
         with st.spinner("🎥 Generating your results..."):
             score = _calculate_score(story_data)
-            poster_path = generate_temp_poster(score, story_data["content"]["title"])
+            with metrics.timer("flow_results_poster"):
+                poster = generate_temp_poster(score, story_data.title, total=total)
         
         st.subheader("🎉 Results")
-        st.image(poster_path)
-        st.markdown(f"### Your Score: {score}/{len(story_data['content']['scenes'])}")
+        if isinstance(poster, str):
+            with asset_store.in_use(poster):
+                st.image(poster)
+        else:
+            st.image(poster)
+        st.markdown(f"### Your Score: {score}/{total}")
         
-        if score < len(story_data["content"]["scenes"]):
-            _display_bloopers(story_data, score)
+        if score < total:
+            _display_bloopers(story_data)
             
     except Exception as e:
         _handle_error(e)
@@ -114,27 +210,16 @@ def _display_results(story_data: Dict):
         st.session_state.quiz_submitted = False
         st.rerun()
 
-def _calculate_score(story_data: Dict) -> int:
+def _calculate_score(story_data: RecipientView) -> int:
     """Calculate user's score"""
-    return sum(
-        1 for u, c, scene in zip(
-            st.session_state.user_answers, 
-            st.session_state.correct_answers, 
-            story_data["content"]["scenes"]
-        ) if u == scene["quiz"]["options"][c]
-    )
+    return sum(1 for u, c in zip(st.session_state.user_answers, story_data.answer_key) if u == c)
 
-def _display_bloopers(story_data: Dict, score: int):
+def _display_bloopers(story_data: RecipientView):
     """Display bloopers for incorrect answers"""
     st.subheader("🎬 Blooper Reel")
-    for i, (u, c) in enumerate(zip(st.session_state.user_answers, st.session_state.correct_answers)):
-        scene = story_data["content"]["scenes"][i]
-        if u != scene["quiz"]["options"][c]:
-            if "bloopers" in story_data["content"] and i < len(story_data["content"]["bloopers"]):
-                blooper = story_data["content"]["bloopers"][i]
-                st.write(f"🎬 Scene {i+1}: {blooper}")
-            else:
-                st.write(f"🎬 Scene {i+1}: No blooper available")
+    for u, scene in zip(st.session_state.user_answers, story_data.scenes):
+        if u != scene.answer:
+            st.markdown(scene.blooper)
     st.markdown("---")
 
 def _handle_error(error: Exception) -> None:
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, conlist
+from pydantic import BaseModel, conlist, model_validator
 from typing import List
 
 class Memory(BaseModel):
@@ -13,7 +13,24 @@ class StoryCreate(BaseModel):
     memories: conlist(Memory, min_length=3, max_length=3)
     personal_qa: conlist(QAPair, min_length=3, max_length=3)
 
+class Quiz(BaseModel):
+    question: str
+    options: conlist(str, min_length=2)
+    correct_index: int
+
+    @model_validator(mode="after")
+    def _check_correct_index(self) -> "Quiz":
+        if not 0 <= self.correct_index < len(self.options):
+            raise ValueError(f"correct_index {self.correct_index} is not one of the {len(self.options)} options")
+        return self
+
+class Scene(BaseModel):
+    scene_number: int
+    content: str
+    quiz: Quiz
+    commentary: str
+
 class GeneratedContent(BaseModel):
     title: str
-    scenes: List[dict]
-    bloopers: List[str]
\ No newline at end of file
+    scenes: conlist(Scene, min_length=1)
+    bloopers: List[str]
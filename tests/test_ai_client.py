@@ -0,0 +1,87 @@
+import json
+from types import SimpleNamespace
+import pytest
+from openai import APIConnectionError
+from core import resilience
+from core.ai_client import DeepSeekClient
+from core.providers import LatencyWindow, ProviderRouter
+from core.resilience import CircuitBreaker
+
+
+def _story(label: str) -> str:
+    return json.dumps({
+        "title": f"Story {label}",
+        "scenes": [
+            {
+                "scene_number": n,
+                "content": f"{label}-{n}",
+                "quiz": {"question": "?", "options": ["a", "b", "c"], "correct_index": 0},
+                "commentary": "",
+            }
+            for n in range(1, 6)
+        ],
+        "bloopers": ["oops"],
+    })
+
+
+def _chunk(text: str):
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class FakeProvider:
+    """Streams the given stories in turn; a story cut short raises after its second scene"""
+
+    def __init__(self, name: str, streams):
+        self.name = name
+        self.model = "fake"
+        self.latency = {"sync": LatencyWindow(), "stream": LatencyWindow()}
+        self.breaker = CircuitBreaker(5, 30, name=name)
+        self.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self.create)))
+        self._streams = list(streams)
+
+    def create(self, **kwargs):
+        text, cut = self._streams.pop(0)
+        if cut:
+            text = text[:text.index('"scene_number": 3')]
+
+        def stream():
+            for i in range(0, len(text), 7):
+                yield _chunk(text[i:i + 7])
+            if cut:
+                raise APIConnectionError(request=None)
+        return stream()
+
+
+def _generate(providers):
+    client = DeepSeekClient.__new__(DeepSeekClient)
+    client.router = ProviderRouter(providers, hedge=False)
+    shown = []
+
+    def on_scene(scene):
+        if scene is None:
+            shown.clear()
+        else:
+            shown.append(scene["content"])
+
+    content = client.generate_story_content("prompt", on_scene=on_scene)
+    return shown, [scene.content for scene in content.scenes]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, "_next_delay", lambda *args: 0)
+
+
+def test_retry_replaces_scenes_of_the_failed_attempt():
+    shown, saved = _generate([FakeProvider("only", [(_story("A"), True), (_story("B"), False)])])
+    assert saved == [f"B-{n}" for n in range(1, 6)]
+    assert shown == saved
+
+
+def test_failover_replaces_scenes_of_the_failed_attempt():
+    shown, saved = _generate([
+        FakeProvider("primary", [(_story("A"), True)]),
+        FakeProvider("backup", [(_story("B"), False)]),
+    ])
+    assert saved == [f"B-{n}" for n in range(1, 6)]
+    assert shown == saved
@@ -0,0 +1,69 @@
+import os
+import time
+import pytest
+from utils.assets import AssetStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AssetStore(root=str(tmp_path), max_bytes=10_000, max_age=60, sweep_interval=60)
+
+
+def _file(store, name, size, age):
+    path = store.put(b"x" * size, suffix=".png", name=name)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def test_put_writes_atomically(store, monkeypatch):
+    path = store.put(b"old", name="poster")
+    assert open(path, "rb").read() == b"old"
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        store.put(b"new", name="poster")
+    # The earlier file is untouched and the partial write is gone.
+    assert open(path, "rb").read() == b"old"
+    assert os.listdir(store.root) == ["poster.png"]
+
+
+def test_sweep_removes_expired_files(store):
+    old = _file(store, "old", 10, age=120)
+    fresh = _file(store, "fresh", 10, age=5)
+    assert store.sweep() == 1
+    assert not os.path.exists(old) and os.path.exists(fresh)
+
+
+def test_sweep_enforces_byte_limit_oldest_first(store):
+    paths = [_file(store, f"f{i}", 4_000, age=30 - i) for i in range(4)]
+    assert store.sweep() == 2
+    assert [os.path.exists(p) for p in paths] == [False, False, True, True]
+
+
+def test_sweep_skips_files_in_use(store):
+    held = _file(store, "held", 4_000, age=120)
+    acquired = _file(store, "acquired", 4_000, age=110)
+    loose = _file(store, "loose", 4_000, age=100)
+    store.acquire(acquired)
+    with store.in_use(held):
+        # acquire()/in_use() refresh the mtime, so age them again.
+        for path, age in ((held, 120), (acquired, 110)):
+            os.utime(path, (time.time() - age, time.time() - age))
+        assert store.sweep() == 1
+    assert os.path.exists(held) and os.path.exists(acquired) and not os.path.exists(loose)
+
+    store.release(acquired)
+    os.utime(held, (time.time() - 120, time.time() - 120))
+    os.utime(acquired, (time.time() - 120, time.time() - 120))
+    assert store.sweep() == 2
+
+
+def test_get_refreshes_age(store):
+    path = _file(store, "poster", 10, age=120)
+    assert store.get("poster") == path
+    assert store.sweep() == 0
+    assert store.get("missing") is None
@@ -0,0 +1,12 @@
+from core.prompts import STORY_SCENES
+from utils.helpers import _build_poster_prompt, _poster_keys
+
+
+def test_poster_prompt_rates_out_of_scene_count():
+    assert f"Represent 4/{STORY_SCENES} " in _build_poster_prompt(4, STORY_SCENES)
+    assert "Represent 2/3 " in _build_poster_prompt(2, 3)
+
+
+def test_poster_keys_depend_on_scene_count():
+    assert _poster_keys(2, 3) != _poster_keys(2, STORY_SCENES)
+    assert _poster_keys(2, STORY_SCENES) == _poster_keys(2, STORY_SCENES)
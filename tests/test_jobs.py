@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from bson.objectid import ObjectId
+from benchmarks.fake_mongo import FakeMongoClient
+from core.idempotency import IDEMPOTENCY_WINDOW_SECONDS
+from core.jobs import FAILED, JOB_MAX_ATTEMPTS, JOB_STALE_SECONDS, QUEUED, RUNNING, JobQueue, QueueFull
+from models.schemas import StoryCreate
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setenv("DB_NAME", "test")
+    return JobQueue(workers=1, max_pending=4, client=FakeMongoClient(latency=0))
+
+
+def test_restart_clears_streamed_scenes(queue):
+    job_id = queue.jobs.insert_one({"scenes": []}).inserted_id
+    for scene in ({"content": "A-1"}, {"content": "A-2"}, None, {"content": "B-1"}):
+        queue._add_scene(job_id, scene)
+    assert queue.jobs.find_one({"_id": job_id})["scenes"] == [{"content": "B-1"}]
+
+
+def _story():
+    return StoryCreate(
+        memories=[{"title": f"m{i}", "description": "d"} for i in range(3)],
+        personal_qa=[{"question": f"q{i}", "answer": "a"} for i in range(3)],
+    )
+
+
+@pytest.fixture
+def dispatched(queue, monkeypatch):
+    ids = []
+    monkeypatch.setattr(queue, "_dispatch", ids.append)
+    return ids
+
+
+def _age(queue, job_id, **fields):
+    """Make a job look untouched since before the stale cutoff"""
+    old = datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_SECONDS + 60)
+    queue.jobs.update_one({"_id": ObjectId(job_id)}, {"$set": dict(fields, updated_at=old)})
+
+
+def test_submit_reuses_job_for_same_key(queue, dispatched):
+    first = queue.submit(_story(), "key")
+    assert queue.submit(_story(), "key") == first
+    assert queue.submit(_story(), "other") != first
+    assert len(dispatched) == 2
+
+
+def test_submit_ignores_failed_and_expired_jobs(queue, dispatched):
+    failed = queue.submit(_story(), "key")
+    queue.jobs.update_one({"_id": ObjectId(failed)}, {"$set": {"state": FAILED}})
+    old = queue.submit(_story(), "key")
+    assert old != failed
+    created = datetime.now(timezone.utc) - timedelta(seconds=IDEMPOTENCY_WINDOW_SECONDS + 1)
+    queue.jobs.update_one({"_id": ObjectId(old)}, {"$set": {"created_at": created}})
+    assert queue.submit(_story(), "key") not in (failed, old)
+
+
+def test_submit_rejects_when_full(queue, dispatched):
+    for i in range(queue.max_pending):
+        queue.submit(_story(), f"key{i}")
+    with pytest.raises(QueueFull):
+        queue.submit(_story(), "one more")
+    assert queue._pending == queue.max_pending
+
+
+def test_stale_job_reads_as_failed(queue, dispatched):
+    job_id = queue.submit(_story(), "key")
+    _age(queue, job_id, state=RUNNING)
+    job = queue.get(job_id)
+    assert job["state"] == FAILED and job["transient"]
+    assert queue.submit(_story(), "key") != job_id
+
+
+def test_live_job_is_not_stale(queue, dispatched):
+    job_id = queue.submit(_story(), "key")
+    assert queue.get(job_id)["state"] == QUEUED
+
+
+def test_recover_requeues_until_attempts_run_out(queue, dispatched):
+    retry = queue.submit(_story(), "retry")
+    exhausted = queue.submit(_story(), "exhausted")
+    _age(queue, retry, state=RUNNING, attempts=JOB_MAX_ATTEMPTS - 1)
+    _age(queue, exhausted, state=RUNNING, attempts=JOB_MAX_ATTEMPTS)
+    dispatched.clear()
+
+    assert queue.recover() == 1
+    assert dispatched == [ObjectId(retry)]
+    assert queue.jobs.find_one({"_id": ObjectId(retry)})["state"] == QUEUED
+    job = queue.jobs.find_one({"_id": ObjectId(exhausted)})
+    assert job["state"] == FAILED and not job["transient"]
+    assert queue.recover() == 0
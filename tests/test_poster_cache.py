@@ -0,0 +1,56 @@
+import os
+import time
+import pytest
+from utils.poster_cache import PosterCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PosterCache(str(tmp_path), memory_bytes=100, disk_bytes=250)
+
+
+def _disk_keys(cache):
+    return sorted(name[:-len(".img")] for name in os.listdir(cache.directory) if name.endswith(".img"))
+
+
+def test_memory_tier_is_bounded_by_bytes(cache):
+    cache.put("a", b"a" * 40)
+    cache.put("b", b"b" * 40)
+    assert cache.get("a") == b"a" * 40
+    cache.put("c", b"c" * 40)
+    # b was least recently used, so it left memory; it is still on disk.
+    assert list(cache._memory) == ["a", "c"]
+    assert cache.stats()["memory_bytes"] == 80
+    assert cache.get("b") == b"b" * 40
+    assert "b" in cache._memory
+
+
+def test_oversized_entry_skips_memory(cache):
+    cache.put("big", b"x" * 150)
+    assert cache.stats()["memory_entries"] == 0
+    assert cache.get("big") == b"x" * 150
+
+
+def test_put_without_memory(cache):
+    cache.put("source", b"s" * 10, memory=False)
+    assert cache.stats()["memory_entries"] == 0
+    assert _disk_keys(cache) == ["source"]
+
+
+def test_disk_tier_evicts_least_recent_first(cache):
+    for i, key in enumerate(["old", "mid", "new"]):
+        cache.put(key, bytes(100))
+        stamp = time.time() - 100 + i
+        os.utime(cache._disk_path(key), (stamp, stamp))
+    cache.put("latest", bytes(100))
+    assert _disk_keys(cache) == ["latest", "new"]
+
+
+def test_disk_hit_after_memory_is_cleared(cache):
+    cache.put("a", b"data")
+    cache._memory.clear()
+    cache._memory_used = 0
+    assert cache.get("a") == b"data"
+    cache.clear()
+    assert cache.get("a") is None
+    assert _disk_keys(cache) == []
@@ -0,0 +1,53 @@
+import sys
+from types import SimpleNamespace
+import pytest
+from core import prompts
+from core.prompts import CHARS_PER_TOKEN, count_tokens, fit_to_budget
+
+
+@pytest.fixture(autouse=True)
+def char_estimate(monkeypatch):
+    # Count by length, so the expected sizes do not depend on tiktoken's vocabulary.
+    monkeypatch.setattr(prompts, "get_encoding", lambda: None)
+
+
+def test_fits_unchanged():
+    texts = ["a" * 40, "b" * 8]
+    assert fit_to_budget(texts, 12) is texts
+
+
+def test_trims_longest_only():
+    short, medium, long = "s" * 4 * CHARS_PER_TOKEN, "m" * 30 * CHARS_PER_TOKEN, "l" * 100 * CHARS_PER_TOKEN
+    fitted = fit_to_budget([long, short, medium], 50)
+    assert fitted[1] == short
+    assert fitted[0].endswith("…") and fitted[2].endswith("…")
+    assert count_tokens(fitted[0]) == count_tokens(fitted[2]) == 23
+    assert sum(count_tokens(t) for t in fitted) <= 50
+
+
+def test_zero_budget():
+    assert fit_to_budget(["abc", "defgh"], 0) == ["…", "…"]
+
+
+def test_failed_tokenizer_load_is_retried(monkeypatch):
+    monkeypatch.undo()
+    monkeypatch.setattr(prompts, "_encoding", None)
+    monkeypatch.setattr(prompts, "_encoding_retry_at", 0.0)
+    vocabulary = SimpleNamespace(encode=lambda text: text.split())
+    attempts = []
+
+    def encoding_for_model(model):
+        attempts.append(model)
+        if len(attempts) == 1:
+            raise OSError("download failed")
+        return vocabulary
+
+    monkeypatch.setitem(sys.modules, "tiktoken", SimpleNamespace(encoding_for_model=encoding_for_model))
+    assert prompts.get_encoding() is None
+    assert count_tokens("three short words") == 5
+    assert len(attempts) == 1
+
+    monkeypatch.setattr(prompts, "_encoding_retry_at", 0.0)
+    assert prompts.get_encoding() is vocabulary
+    assert count_tokens("three short words") == 3
+    assert len(attempts) == 2
@@ -0,0 +1,115 @@
+import asyncio
+import pytest
+from core import providers
+from core.providers import LatencyWindow, ProviderRouter
+from core.resilience import CircuitBreaker
+
+
+class FakeProvider:
+    """The parts of Provider the router uses, with a known p90 of 50 ms"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latency = {"stream": LatencyWindow()}
+        for _ in range(20):
+            self.latency["stream"].add(0.05)
+        self.breaker = CircuitBreaker(5, 30, name=name)
+
+
+class Flaky(Exception):
+    pass
+
+
+@pytest.fixture
+def counted(monkeypatch):
+    calls = []
+    monkeypatch.setattr(providers.metrics, "inc", lambda name, amount=1.0, **labels: calls.append((name, labels)))
+    return calls
+
+
+def _attempts(behaviour):
+    """attempt() that answers after the provider's delay, or raises Flaky; records cancellations"""
+    started, cancelled = [], []
+
+    async def attempt(provider, claim):
+        started.append(provider.name)
+        delay, error = behaviour[provider.name]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(provider.name)
+            raise
+        if error:
+            raise Flaky(provider.name)
+        if not claim():
+            return None
+        return provider.name
+
+    return attempt, started, cancelled
+
+
+def test_hedge_wins_and_cancels_primary(counted):
+    primary, backup = FakeProvider("primary"), FakeProvider("backup")
+    router = ProviderRouter([primary, backup], hedge=True)
+    attempt, started, cancelled = _attempts({"primary": (5, False), "backup": (0.01, False)})
+
+    assert asyncio.run(router.acall(attempt, (Flaky,), "stream")) == "backup"
+    assert started == ["primary", "backup"]
+    assert cancelled == ["primary"]
+    assert ("lovereel_llm_hedges_total", {"provider": "backup"}) in counted
+    assert ("lovereel_llm_hedge_wins_total", {"provider": "backup"}) in counted
+    # The cancelled primary is charged for the time it was silent.
+    assert max(v for _, v in primary.latency["stream"]._samples) >= 0.05
+
+
+def test_fast_primary_is_not_hedged(counted):
+    router = ProviderRouter([FakeProvider("primary"), FakeProvider("backup")], hedge=True)
+    attempt, started, cancelled = _attempts({"primary": (0, False), "backup": (0, False)})
+
+    assert asyncio.run(router.acall(attempt, (Flaky,), "stream")) == "primary"
+    assert started == ["primary"]
+    assert counted == []
+
+
+def test_failover_is_not_a_hedge_win(counted):
+    primary = FakeProvider("primary")
+    router = ProviderRouter([primary, FakeProvider("backup")], hedge=False)
+    attempt, started, cancelled = _attempts({"primary": (0, True), "backup": (0, False)})
+
+    assert asyncio.run(router.acall(attempt, (Flaky,), "stream")) == "backup"
+    assert started == ["primary", "backup"]
+    assert counted == []
+    assert primary.breaker._failures == 1
+
+
+def test_non_retryable_error_cancels_hedge(counted):
+    router = ProviderRouter([FakeProvider("primary"), FakeProvider("backup")], hedge=True)
+    attempt, started, cancelled = _attempts({"primary": (0.1, True), "backup": (5, False)})
+
+    with pytest.raises(Flaky):
+        asyncio.run(router.acall(attempt, (ValueError,), "stream"))
+    assert started == ["primary", "backup"]
+    assert cancelled == ["backup"]
+
+
+def test_hedge_releases_its_reservation(counted):
+    router = ProviderRouter([FakeProvider("primary"), FakeProvider("backup")], hedge=True)
+    attempt, started, cancelled = _attempts({"primary": (5, False), "backup": (0.01, False)})
+    done = []
+
+    async def run():
+        result = await router.acall(attempt, (Flaky,), "stream", hedge_done=lambda: done.append(True))
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == "backup"
+    assert done == [True]
+
+
+def test_no_hedge_without_capacity(counted):
+    router = ProviderRouter([FakeProvider("primary"), FakeProvider("backup")], hedge=True)
+    attempt, started, cancelled = _attempts({"primary": (0.2, False), "backup": (0, False)})
+
+    assert asyncio.run(router.acall(attempt, (Flaky,), "stream", may_hedge=lambda: False)) == "primary"
+    assert started == ["primary"]
+    assert counted == []
@@ -0,0 +1,31 @@
+from core.database import Database, missing_story_cache, story_cache
+from flows.recipient import client_address
+
+
+def test_peer_without_proxies():
+    assert client_address(None, "203.0.113.7", 0) == "203.0.113.7"
+    assert client_address(None, None, 0) is None
+
+
+def test_undeclared_proxy_is_not_a_client():
+    assert client_address("203.0.113.7", "10.0.0.2", 0) is None
+
+
+def test_hop_added_by_trusted_proxy():
+    # The client prepended a fake entry; only the rightmost hops are from proxies.
+    assert client_address("1.2.3.4, 203.0.113.7", "10.0.0.2", 1) == "203.0.113.7"
+    assert client_address("1.2.3.4, 203.0.113.7, 10.0.0.9", "10.0.0.2", 2) == "203.0.113.7"
+    assert client_address("203.0.113.7", "10.0.0.2", 2) is None
+    assert client_address(None, "10.0.0.2", 1) is None
+
+
+def test_cached_lookups_are_known_without_a_query():
+    found, missing = "65a000000000000000000001", "65a000000000000000000002"
+    assert not Database.is_cached(found)
+    story_cache.set(found, object())
+    missing_story_cache.set(missing, True)
+    try:
+        assert Database.is_cached(found) and Database.is_cached(missing)
+    finally:
+        story_cache.pop(found)
+        missing_story_cache.pop(missing)
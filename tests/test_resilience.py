@@ -0,0 +1,55 @@
+import asyncio
+import time
+from core import ai_client
+from core.resilience import AsyncSlots, TokenBucket
+
+
+def test_slots_limit_and_hand_over_in_order():
+    async def run():
+        slots = AsyncSlots(1)
+        assert slots.try_acquire()
+        assert not slots.try_acquire()
+        order = []
+
+        async def wait(name):
+            await slots.acquire()
+            order.append(name)
+
+        waiters = [asyncio.ensure_future(wait(n)) for n in ("first", "second")]
+        await asyncio.sleep(0)
+        # A waiter is queued, so try_acquire must not jump ahead of it.
+        slots.release()
+        assert not slots.try_acquire()
+        await asyncio.sleep(0)
+        slots.release()
+        await asyncio.gather(*waiters)
+        slots.release()
+        assert order == ["first", "second"]
+        assert slots.try_acquire()
+
+    asyncio.run(run())
+
+
+def test_slot_wait_times_out():
+    async def run():
+        slots = AsyncSlots(1)
+        await slots.acquire()
+        assert not await slots.acquire(deadline=time.monotonic() + 0.01)
+        slots.release()
+        assert slots.try_acquire()
+
+    asyncio.run(run())
+
+
+def test_hedge_needs_a_free_slot(monkeypatch):
+    slots = AsyncSlots(1)
+    monkeypatch.setattr(ai_client, "_async_inflight", slots)
+    monkeypatch.setattr(ai_client, "_rate_limiter", TokenBucket(rate=1, capacity=5))
+    assert ai_client._may_hedge()
+    assert not ai_client._may_hedge()
+    slots.release()
+
+    monkeypatch.setattr(ai_client, "_rate_limiter", TokenBucket(rate=0.001, capacity=0))
+    assert not ai_client._may_hedge()
+    # The slot taken before the rate limiter said no is given back.
+    assert slots.try_acquire()
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+from bson.objectid import ObjectId
+from core.results import stats_updates
+
+
+def _event(story_id, answers, key, seconds=None, at=None):
+    correct = [a == k for a, k in zip(answers, key)]
+    return {
+        "_id": ObjectId(),
+        "story_id": story_id,
+        "answers": answers,
+        "correct": correct,
+        "score": sum(correct),
+        "total": len(key),
+        "seconds": seconds,
+        "created_at": at or datetime.now(timezone.utc),
+    }
+
+
+def test_one_update_per_story():
+    first, second = ObjectId(), ObjectId()
+    now = datetime.now(timezone.utc)
+    events = [
+        _event(second, [0, 1], [0, 1], seconds=12.5, at=now),
+        _event(first, [2, 1], [0, 1], at=now),
+        _event(second, [1, 1], [0, 1], seconds=7.5, at=now - timedelta(minutes=1)),
+    ]
+    updates = stats_updates(events)
+    assert [u._filter for u in updates] == [{"_id": second}, {"_id": first}]
+    assert all(u._upsert for u in updates)
+
+    doc = updates[0]._doc
+    assert doc["$set"] == {"last_played_at": now}
+    assert doc["$inc"] == {
+        "plays": 2,
+        "score_sum": 3,
+        "scores.2": 1,
+        "scores.1": 1,
+        "perfect": 1,
+        "timed_plays": 2,
+        "seconds_sum": 20.0,
+        "questions.0.answers.0": 1,
+        "questions.0.answers.1": 1,
+        "questions.0.correct": 1,
+        "questions.1.answers.1": 2,
+        "questions.1.correct": 2,
+    }
+    assert updates[1]._doc["$inc"] == {
+        "plays": 1,
+        "score_sum": 1,
+        "scores.1": 1,
+        "questions.0.answers.2": 1,
+        "questions.1.answers.1": 1,
+        "questions.1.correct": 1,
+    }
+
+
+def test_no_events():
+    assert stats_updates([]) == []
@@ -0,0 +1,54 @@
+import json
+import random
+from core.ai_client import SceneStreamParser
+
+
+def _scene(number: int) -> dict:
+    return {
+        "scene_number": number,
+        "content": f'Scene {number}: "quoted", {{braces}} and [brackets] \\ backslash',
+        "quiz": {"question": "Where?", "options": ["a", "b}", "c]"], "correct_index": 1},
+        "commentary": "A \"scenes\" key inside a string",
+    }
+
+
+COMPLETION = json.dumps({
+    "title": "Title with {\"scenes\": [",
+    "scenes": [_scene(n) for n in range(1, 6)],
+    "bloopers": ["{not a scene}"],
+})
+
+
+def _feed(chunks):
+    parser = SceneStreamParser()
+    scenes = []
+    for chunk in chunks:
+        scenes.extend(parser.feed(chunk))
+    return parser, scenes
+
+
+def test_whole_completion():
+    parser, scenes = _feed([COMPLETION])
+    assert scenes == [_scene(n) for n in range(1, 6)]
+    assert parser.text() == COMPLETION
+
+
+def test_random_chunk_sizes():
+    rng = random.Random(5)
+    for _ in range(200):
+        chunks, i = [], 0
+        while i < len(COMPLETION):
+            size = rng.randint(1, 40)
+            chunks.append(COMPLETION[i:i + size])
+            i += size
+        parser, scenes = _feed(chunks)
+        assert scenes == [_scene(n) for n in range(1, 6)]
+        assert parser.text() == COMPLETION
+
+
+def test_scene_emitted_once_complete():
+    parser = SceneStreamParser()
+    first = json.dumps(_scene(1))
+    assert parser.feed('{"title": "t", "scenes": [' + first[:-1]) == []
+    assert parser.feed(first[-1]) == [_scene(1)]
+    assert parser.feed(', ' + json.dumps(_scene(2)) + ']}') == [_scene(2)]
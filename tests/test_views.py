@@ -0,0 +1,95 @@
+import pytest
+from pydantic import ValidationError
+from benchmarks.fake_mongo import FakeMongoClient
+from core.database import Database
+from core.views import STORY_ENCODING_VERSION, decode_view, encode_story, escape_markdown, unescape_markdown
+from models.schemas import GeneratedContent, Quiz
+
+SPECIAL = "\\`*_{}[]()#+-.!|<>~$:"
+
+
+def _content(scenes: int = 2, bloopers: int = 2, text: str = "plain") -> GeneratedContent:
+    return GeneratedContent(
+        title=f"Title {text}",
+        scenes=[
+            {
+                "scene_number": n,
+                "content": f"Scene {n} {text}",
+                "quiz": {"question": f"Q{n} {text}?", "options": [f"{text} a", "b", "c"], "correct_index": n % 3},
+                "commentary": f"Note {text}",
+            }
+            for n in range(1, scenes + 1)
+        ],
+        bloopers=[f"Blooper {i}" for i in range(1, bloopers + 1)],
+    )
+
+
+@pytest.mark.parametrize("text", [
+    SPECIAL,
+    "".join(c * 2 for c in SPECIAL),
+    "\\\\already \\*escaped\\* \\",
+    "line\nbreak $5 costs 1.5 - 2 <b>bold</b>",
+    "",
+])
+def test_escape_round_trip(text):
+    escaped = escape_markdown(text)
+    assert unescape_markdown(escaped) == text
+
+
+def test_every_special_character_is_escaped():
+    assert escape_markdown(SPECIAL) == "".join("\\" + c for c in SPECIAL)
+    assert escape_markdown("plain words") == "plain words"
+
+
+def test_encode_decode_round_trip():
+    content = _content(text=SPECIAL)
+    encoded = encode_story(content)
+    assert encoded["v"] == STORY_ENCODING_VERSION
+    view = decode_view(encoded)
+    assert view.title == content.title
+    assert view.title_md == escape_markdown(content.title)
+    assert view.answer_key == tuple(s.quiz.correct_index for s in content.scenes)
+    for scene, shown in zip(content.scenes, view.scenes):
+        assert unescape_markdown(shown.body) == scene.content
+        assert unescape_markdown(shown.question) == scene.quiz.question
+        assert tuple(unescape_markdown(o) for o in shown.options) == tuple(scene.quiz.options)
+        assert shown.heading == f"## Scene {scene.scene_number}"
+
+
+def test_fewer_bloopers_than_scenes():
+    encoded = encode_story(_content(scenes=3, bloopers=1))
+    assert [s["x"] for s in encoded["sc"]] == ["Blooper 1", None, None]
+    assert "bx" not in encoded
+    view = decode_view(encoded)
+    assert view.scenes[0].blooper == "🎬 Scene 1: Blooper 1"
+    assert view.scenes[2].blooper == "🎬 Scene 3: No blooper available"
+
+
+def test_more_bloopers_than_scenes():
+    encoded = encode_story(_content(scenes=2, bloopers=4))
+    assert [s["x"] for s in encoded["sc"]] == ["Blooper 1", "Blooper 2"]
+    assert encoded["bx"] == ["Blooper 3", "Blooper 4"]
+
+
+@pytest.mark.parametrize("index", [-1, 3])
+def test_out_of_range_correct_index_is_rejected(index):
+    with pytest.raises(ValidationError):
+        Quiz(question="?", options=["a", "b", "c"], correct_index=index)
+
+
+def test_legacy_document_is_migrated_on_read(monkeypatch):
+    monkeypatch.setenv("DB_NAME", "test")
+    database = Database(FakeMongoClient(latency=0))
+    content = _content(text="*legacy*")
+    story_id = database.stories.insert_one({
+        "content": content.model_dump(),
+        "view": {"old": True},
+    }).inserted_id
+
+    view = database._load_recipient_view(str(story_id))
+
+    assert view == decode_view(encode_story(content))
+    doc = database.stories.find_one({"_id": story_id})
+    assert doc["story"] == encode_story(content)
+    assert "content" not in doc and "view" not in doc
+    assert "last_read_at" in doc
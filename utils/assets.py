@@ -0,0 +1,153 @@
+import os
+import time
+import uuid
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class AssetStore:
+    """Directory of generated files with one janitor thread per process.
+
+    Writes are atomic (temp file + rename). The janitor removes files older than
+    max_age and then the least recently used files until the directory fits in
+    max_bytes, skipping anything currently held through acquire()/in_use().
+    """
+
+    def __init__(self, root: Optional[str], max_bytes: int, max_age: float, sweep_interval: float):
+        self._root = root
+        self._root_ready = False
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+        self._refs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._janitor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def root(self) -> str:
+        """Asset directory, created on first use; a fresh temp directory when unset"""
+        if not self._root_ready:
+            with self._lock:
+                if not self._root_ready:
+                    self._root = self._root or tempfile.mkdtemp(prefix="lovereel_assets_")
+                    os.makedirs(self._root, exist_ok=True)
+                    self._root_ready = True
+        return self._root
+
+    def put(self, data: bytes, suffix: str = ".png", name: Optional[str] = None) -> str:
+        """Atomically write data and return its path"""
+        path = os.path.join(self.root, (name or uuid.uuid4().hex) + suffix)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return path
+
+    def get(self, name: str, suffix: str = ".png") -> Optional[str]:
+        """Path of a previously stored file, refreshed for age-based eviction"""
+        path = os.path.join(self.root, name + suffix)
+        if not os.path.exists(path):
+            return None
+        self.touch(path)
+        return path
+
+    def touch(self, path: str) -> None:
+        """Mark a file as recently used so age-based eviction keeps it"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def acquire(self, path: str) -> None:
+        with self._lock:
+            self._refs[path] = self._refs.get(path, 0) + 1
+        self.touch(path)
+
+    def release(self, path: str) -> None:
+        with self._lock:
+            count = self._refs.get(path, 0) - 1
+            if count > 0:
+                self._refs[path] = count
+            else:
+                self._refs.pop(path, None)
+
+    @contextmanager
+    def in_use(self, path: str):
+        """Protect a file from the janitor while it is being read or served"""
+        self.acquire(path)
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def sweep(self) -> int:
+        """Evict expired and excess files; returns the number removed"""
+        if not self._root_ready:
+            return 0
+        now = time.time()
+        entries = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if entry.is_file():
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        with self._lock:
+            held = set(self._refs)
+
+        removed = 0
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in sorted(entries):
+            if path in held:
+                continue
+            if now - mtime < self.max_age and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+                total -= size
+            except OSError:
+                pass
+        return removed
+
+    def start_janitor(self) -> None:
+        """Start the sweeping thread; later calls are no-ops"""
+        if self._janitor is not None:
+            return
+        with self._lock:
+            if self._janitor is not None:
+                return
+            self._janitor = threading.Thread(target=self._run_janitor, name="asset-janitor", daemon=True)
+            self._janitor.start()
+
+    def stop_janitor(self) -> None:
+        self._stop.set()
+
+    def _run_janitor(self) -> None:
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Asset sweep failed: {str(e)}")
+
+
+asset_store = AssetStore(
+    root=os.getenv("ASSET_DIR"),
+    max_bytes=int(os.getenv("ASSET_MAX_MB", "256")) * 1024 * 1024,
+    max_age=float(os.getenv("ASSET_MAX_AGE_SECONDS", "300")),
+    sweep_interval=float(os.getenv("ASSET_SWEEP_INTERVAL_SECONDS", "60")),
+)
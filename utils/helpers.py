@@ -1,17 +1,25 @@
 import os
+import asyncio
+import base64
 import random
-import requests
-import tempfile
-import time
-from PIL import Image, ImageDraw, ImageFont
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from io import BytesIO
 import streamlit as st
-from openai import OpenAI
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING, Dict, Optional, Tuple, Union
+from utils.poster_cache import PosterCache, poster_cache
+from utils.assets import asset_store
+from core import metrics
+from core import aio
+from core.prompts import STORY_SCENES
 
-load_dotenv()
+if TYPE_CHECKING:
+    import requests
+    from openai import OpenAI
 
-temp_dir = tempfile.mkdtemp()
+# openai, requests, PIL and utils.poster_engine (numpy) are imported where they are
+# first needed, so a page that never renders a poster does not pay for them.
 
 
 def validate_memory_input(title: str, description: str) -> bool:
@@ -19,70 +27,283 @@ def validate_memory_input(title: str, description: str) -> bool:
     return len(title.strip()) > 2 and len(description.strip()) > 10
 
 
-def generate_temp_poster(score: int, story_title: str) -> str:
-    """Generate AI-powered movie poster using DeepSeek"""
-    try:
-        client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-        )
-        
-        prompt = f"""Create a romantic comedy movie poster with these elements:
+# "ai" generates posters with the image model; "local" renders them with utils.poster_engine.
+POSTER_MODE = os.getenv("POSTER_MODE", "ai")
+POSTER_MODEL = "dall-e-3"
+POSTER_SIZE = "1792x1024"
+POSTER_TIMEOUT_SECONDS = float(os.getenv("POSTER_TIMEOUT_SECONDS", "120"))
+# "b64_json" returns the image inline; "url" downloads it over the pooled session.
+POSTER_RESPONSE_FORMAT = os.getenv("POSTER_RESPONSE_FORMAT", "b64_json")
+# Posters are shown as a JPEG no wider than this; st.image passes such bytes through
+# untouched, while wider or non-JPEG RGB images are decoded and re-encoded per render.
+# Set to 0 to serve the original image.
+POSTER_DISPLAY_WIDTH = int(os.getenv("POSTER_DISPLAY_WIDTH", "1024"))
+POSTER_DISPLAY_QUALITY = int(os.getenv("POSTER_DISPLAY_QUALITY", "85"))
+
+POSTER_WORKERS = int(os.getenv("POSTER_WORKERS", "2"))
+
+_poster_executor = ThreadPoolExecutor(
+    max_workers=POSTER_WORKERS,
+    thread_name_prefix="poster"
+)
+# Bounds AI poster jobs on the shared event loop like the executor does for threads.
+_async_poster_slots: Optional[asyncio.Semaphore] = None
+_inflight_posters: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+_clients_lock = threading.Lock()
+_image_client: Optional["OpenAI"] = None
+_http_session: Optional["requests.Session"] = None
+
+
+def _get_image_client() -> "OpenAI":
+    """Shared OpenAI client so image requests reuse its connection pool"""
+    global _image_client
+    if _image_client is None:
+        with _clients_lock:
+            if _image_client is None:
+                from openai import OpenAI
+                _image_client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                )
+    return _image_client
+
+
+def _get_http_session() -> "requests.Session":
+    """Shared keep-alive session for image downloads"""
+    global _http_session
+    if _http_session is None:
+        with _clients_lock:
+            if _http_session is None:
+                import requests
+                import requests.adapters
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=POSTER_WORKERS * 2
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+
+def warm_clients() -> None:
+    """Create the shared image and download clients before the first poster needs them"""
+    _get_image_client()
+    _get_http_session()
+    if POSTER_MODE == "local":
+        from utils.poster_engine import POSTER_LOCAL_SIZE, base_layer
+        base_layer(POSTER_LOCAL_SIZE)
+
+
+def _build_poster_prompt(score: int, total: int) -> str:
+    """Build the image prompt; it depends only on the score out of total"""
+    return f"""Create a romantic comedy movie poster with these elements:
         - Style: Romantic comedy with vintage elements
         - Visual theme: Combine whimsical romance and playful humor
         - Color scheme: Warm pastels with gold accents
         - Required elements: Visual representations of love (hearts, roses, etc.) and comedy (playful/funny moments between couples)
-        - Quality rating: Represent {score}/3 through visual star elements
+        - Quality rating: Represent {score}/{total} through visual star elements
 
         IMPORTANT: This image MUST NOT contain any text, words, letters, numbers, or written elements of any kind. The entire poster should communicate purely through visuals, symbols, and imagery.
         """
-        
-        response = client.images.generate(
-            model="dall-e-3",
+
+
+def _poster_keys(score: int, total: int) -> Tuple[str, str]:
+    """Cache keys for the source image and the image actually displayed"""
+    source_key = PosterCache.make_key(_build_poster_prompt(score, total), POSTER_SIZE, POSTER_MODEL)
+    if POSTER_DISPLAY_WIDTH <= 0:
+        return source_key, source_key
+    variant = f"jpeg|{POSTER_DISPLAY_WIDTH}|{POSTER_DISPLAY_QUALITY}"
+    return source_key, PosterCache.make_key(variant, POSTER_SIZE, source_key)
+
+
+def _fetch_ai_poster(prompt: str) -> bytes:
+    """Call images.generate and return the encoded image bytes as delivered"""
+    with metrics.timer("poster_generate", model=POSTER_MODEL):
+        response = _get_image_client().images.generate(
+            model=POSTER_MODEL,
             prompt=prompt,
-            size="1792x1024",
+            size=POSTER_SIZE,
             n=1,
-            quality="standard"
+            quality="standard",
+            response_format=POSTER_RESPONSE_FORMAT
         )
-        
-        image_url = response.data[0].url
-        
-        img_response = requests.get(image_url)
-        img = Image.open(BytesIO(img_response.content))
-        # img_path = f"poster_{score}_{story_title[:20]}.png" 
-        img_path = os.path.join(temp_dir, f"poster_{score}_{story_title[:20]}.png")
-        img.save(img_path)
-        return img_path
+    
+    image = response.data[0]
+    if image.b64_json:
+        return base64.b64decode(image.b64_json)
+
+    with metrics.timer("poster_download"):
+        return _download_poster(image.url)
+
+
+def _download_poster(url: str) -> bytes:
+    with _get_http_session().get(url, stream=True, timeout=POSTER_TIMEOUT_SECONDS) as img_response:
+        img_response.raise_for_status()
+        return b"".join(img_response.iter_content(chunk_size=256 * 1024))
+
+
+async def _afetch_ai_poster(prompt: str) -> bytes:
+    """_fetch_ai_poster on AsyncOpenAI and the async HTTP client"""
+    with metrics.timer("poster_generate", model=POSTER_MODEL, backend="async"):
+        response = await aio.get_async_openai().images.generate(
+            model=POSTER_MODEL,
+            prompt=prompt,
+            size=POSTER_SIZE,
+            n=1,
+            quality="standard",
+            response_format=POSTER_RESPONSE_FORMAT,
+            timeout=POSTER_TIMEOUT_SECONDS
+        )
+
+    image = response.data[0]
+    if image.b64_json:
+        return base64.b64decode(image.b64_json)
+
+    with metrics.timer("poster_download", backend="async"):
+        http = aio.get_async_http()
+        if http is None:
+            return await asyncio.to_thread(_download_poster, image.url)
+        img_response = await http.get(image.url, timeout=POSTER_TIMEOUT_SECONDS)
+        img_response.raise_for_status()
+        return img_response.content
+
+
+def _make_display_variant(source: bytes) -> bytes:
+    """Downscale once to a JPEG that st.image can serve without re-encoding"""
+    from PIL import Image
+
+    with metrics.timer("poster_encode"):
+        img = Image.open(BytesIO(source))
+        img.draft("RGB", (POSTER_DISPLAY_WIDTH, POSTER_DISPLAY_WIDTH))
+        img = img.convert("RGB")
+        if img.width > POSTER_DISPLAY_WIDTH:
+            height = round(img.height * POSTER_DISPLAY_WIDTH / img.width)
+            img = img.resize((POSTER_DISPLAY_WIDTH, height), Image.LANCZOS)
+        buffer = BytesIO()
+        img.save(buffer, format="JPEG", quality=POSTER_DISPLAY_QUALITY, optimize=True)
+        return buffer.getvalue()
+
+
+def _render_ai_poster(score: int, total: int) -> bytes:
+    """Produce the displayable AI poster for a score through the poster cache"""
+    source_key, display_key = _poster_keys(score, total)
+    poster = poster_cache.get(display_key)
+    if poster is not None:
+        return poster
+
+    source = poster_cache.get(source_key)
+    if source is None:
+        source = _fetch_ai_poster(_build_poster_prompt(score, total))
+        poster_cache.put(source_key, source, memory=display_key == source_key)
+    if display_key == source_key:
+        return source
+
+    poster = _make_display_variant(source)
+    poster_cache.put(display_key, poster)
+    return poster
+
+
+async def _arender_ai_poster(score: int, total: int) -> bytes:
+    """_render_ai_poster for the shared event loop; encoding runs in a worker thread"""
+    global _async_poster_slots
+    if _async_poster_slots is None:
+        _async_poster_slots = asyncio.Semaphore(POSTER_WORKERS)
+    async with _async_poster_slots:
+        source_key, display_key = _poster_keys(score, total)
+        poster = poster_cache.get(display_key)
+        if poster is not None:
+            return poster
+
+        source = poster_cache.get(source_key)
+        if source is None:
+            source = await _afetch_ai_poster(_build_poster_prompt(score, total))
+            poster_cache.put(source_key, source, memory=display_key == source_key)
+        if display_key == source_key:
+            return source
+
+        poster = await asyncio.to_thread(_make_display_variant, source)
+        poster_cache.put(display_key, poster)
+        return poster
+
+
+def _submit_poster(score: int, total: int) -> Future:
+    """Schedule poster generation, joining an in-flight job for the same poster"""
+    _, key = _poster_keys(score, total)
+    with _inflight_lock:
+        future = _inflight_posters.get(key)
+        created = future is None
+        if created:
+            if aio.use_async():
+                future = aio.submit(_arender_ai_poster(score, total))
+            else:
+                future = _poster_executor.submit(_render_ai_poster, score, total)
+            _inflight_posters[key] = future
+    if created:
+        future.add_done_callback(lambda _: _forget_poster_job(key))
+    return future
+
+
+def _forget_poster_job(key: str) -> None:
+    with _inflight_lock:
+        _inflight_posters.pop(key, None)
+
+
+def _log_prefetch_failure(future: Future) -> None:
+    if future.exception() is not None:
+        logging.error(f"Poster prefetch failed: {str(future.exception())}")
+
+
+def prefetch_posters(scene_count: int) -> None:
+    """Pre-generate the poster for every reachable score in the background"""
+    if POSTER_MODE == "local":
+        from utils.poster_engine import POSTER_LOCAL_SIZE, base_layer
+        _poster_executor.submit(base_layer, POSTER_LOCAL_SIZE)
+        return
+    for score in range(scene_count + 1):
+        _submit_poster(score, scene_count).add_done_callback(_log_prefetch_failure)
+
+
+async def apreload_posters(scene_count: int) -> None:
+    """Bring the posters a recipient may see into memory ahead of the results page"""
+    if POSTER_MODE == "local":
+        from utils.poster_engine import POSTER_LOCAL_SIZE, base_layer
+        await asyncio.to_thread(base_layer, POSTER_LOCAL_SIZE)
+        return
+    keys = [_poster_keys(score, scene_count)[1] for score in range(scene_count + 1)]
+    await asyncio.to_thread(lambda: [poster_cache.get(key) for key in keys])
+
+
+def generate_temp_poster(score: int, story_title: str, total: int = STORY_SCENES) -> Union[bytes, str]:
+    """Return the displayable poster for a score, waiting on any in-flight AI job"""
+    if POSTER_MODE == "local":
+        return _generate_fallback_poster(score, story_title, total)
+    try:
+        _, key = _poster_keys(score, total)
+        poster = poster_cache.get(key)
+        if poster is not None:
+            return poster
+        return _submit_poster(score, total).result(timeout=POSTER_TIMEOUT_SECONDS)
     
     except Exception as e:
         st.error(f"AI poster generation failed: {str(e)}")
-        return _generate_fallback_poster(score, story_title)
+        return _generate_fallback_poster(score, story_title, total)
 
-def _generate_fallback_poster(score: int, title: str) -> str:
-    """Local fallback poster generator"""
-    img = Image.new('RGB', (1024, 1792), color=(20, 20, 20))
-    d = ImageDraw.Draw(img)
-    
-    try:
-        font = ImageFont.truetype("arial.ttf", 100)
-    except:
-        font = ImageFont.load_default()
+def _generate_fallback_poster(score: int, title: str, total: int = STORY_SCENES) -> str:
+    """Render the poster locally; identical renders share one file"""
+    from utils.poster_engine import poster_name, render_poster
 
-    d.text((100, 200), title, fill=(255,255,255), font=font)
-    d.text((100, 300), f"Score: {score}/3", fill=(255,255,0), font=font)
-    img_path = os.path.join(temp_dir, "temp_poster.png")
-    img.save(img_path)
-    return img_path
+    name = poster_name(score, total, title)
+    path = asset_store.get(name, suffix=".jpg")
+    if path is None:
+        with metrics.timer("poster_local_render"):
+            poster = render_poster(score, total, title)
+        path = asset_store.put(poster, suffix=".jpg", name=name)
+    return path
 
 def format_shareable_link(story_id: str) -> str:
     """Generate formatted shareable URL"""
     base_url = os.getenv("BASE_URL", "http://localhost:8501")
     return f"{base_url}/?story_id={story_id}"
-
-def cleanup_temp_files():
-    while True:
-        cutoff = time.time() - 300  
-        for filename in os.listdir(temp_dir):
-            filepath = os.path.join(temp_dir, filename)
-            if os.path.getctime(filepath) < cutoff:
-                os.remove(filepath)
-        time.sleep(60) 
\ No newline at end of file
@@ -0,0 +1,139 @@
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+from core import metrics
+
+
+class PosterCache:
+    """Content-addressed poster store with a memory tier in front of a disk tier.
+
+    Keys are derived from the prompt, size and model only, so a poster is shared
+    by every session and story that asks for the same image. Both tiers are
+    bounded by total bytes and evict least recently used entries first.
+    """
+
+    def __init__(self, directory: str, memory_bytes: int, disk_bytes: int):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(prompt: str, size: str, model: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{model}|{size}|{prompt_hash}".encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.img")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+        if data is not None:
+            metrics.inc("lovereel_cache_requests_total", cache="poster", result="memory_hit")
+            return data
+
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            metrics.inc("lovereel_cache_requests_total", cache="poster", result="miss")
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self._remember(key, data)
+        metrics.inc("lovereel_cache_requests_total", cache="poster", result="disk_hit")
+        return data
+
+    def put(self, key: str, data: bytes, memory: bool = True) -> None:
+        """Store data on disk and, unless memory is False, in the memory tier"""
+        if memory:
+            with self._lock:
+                self._remember(key, data)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._disk_path(key))
+            self._evict_disk()
+        except OSError as e:
+            logging.error(f"Poster cache disk write failed: {str(e)}")
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_used -= len(previous)
+        self._memory[key] = data
+        self._memory_used += len(data)
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted)
+
+    def _evict_disk(self) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".img"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(".img"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+poster_cache = PosterCache(
+    directory=os.getenv("POSTER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "lovereel_posters")),
+    memory_bytes=int(os.getenv("POSTER_CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+    disk_bytes=int(os.getenv("POSTER_CACHE_DISK_MB", "512")) * 1024 * 1024,
+)
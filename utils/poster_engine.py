@@ -0,0 +1,171 @@
+import os
+import math
+import hashlib
+from functools import lru_cache
+from io import BytesIO
+from typing import Optional, Tuple
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+POSTER_LOCAL_SIZE = tuple(int(v) for v in os.getenv("POSTER_LOCAL_SIZE", "1024x1792").split("x"))
+POSTER_LOCAL_QUALITY = int(os.getenv("POSTER_LOCAL_QUALITY", "88"))
+
+FONT_CANDIDATES = (
+    os.getenv("POSTER_FONT_PATH", ""),
+    "/usr/share/fonts/truetype/dejavu/DejaVuSerif-Bold.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf",
+    "/Library/Fonts/Arial Bold.ttf",
+    "arialbd.ttf",
+    "arial.ttf",
+)
+
+GOLD = (236, 196, 110, 255)
+GOLD_DIM = (236, 196, 110, 90)
+CREAM = (255, 244, 232, 255)
+
+
+@lru_cache(maxsize=16)
+def load_font(size: int) -> ImageFont.ImageFont:
+    """Load the first available TrueType font at a size, once per size"""
+    for path in FONT_CANDIDATES:
+        if not path:
+            continue
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=4)
+def base_layer(size: Tuple[int, int]) -> Image.Image:
+    """Gradient, glow and heart pattern shared by every poster of a size.
+
+    The returned image is shared; callers must copy it before drawing.
+    """
+    width, height = size
+    y = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None]
+    x = np.linspace(-1.0, 1.0, width, dtype=np.float32)[None, :]
+
+    top = np.array([58, 18, 48], dtype=np.float32)
+    bottom = np.array([214, 110, 128], dtype=np.float32)
+    gradient = top + (bottom - top) * y[..., None]
+
+    glow = np.exp(-((x / 0.8) ** 2 + ((y - 0.35) / 0.35) ** 2))[..., None]
+    vignette = (1.0 - 0.45 * np.clip(np.sqrt(x ** 2 + (2 * y - 1) ** 2) - 0.6, 0, 1))[..., None]
+    pixels = (gradient + glow * np.array([70, 40, 30], dtype=np.float32)) * vignette
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB").convert("RGBA")
+
+    pattern = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(pattern)
+    rng = np.random.default_rng(14)
+    for _ in range(60):
+        cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+        _draw_heart(draw, cx, cy, rng.uniform(12, 40), (255, 220, 230, int(rng.uniform(18, 60))))
+    margin = width // 24
+    draw.rectangle((margin, margin, width - margin, height - margin), outline=GOLD, width=4)
+    draw.rectangle((margin + 14, margin + 14, width - margin - 14, height - margin - 14), outline=GOLD_DIM, width=2)
+    return Image.alpha_composite(image, pattern)
+
+
+@lru_cache(maxsize=64)
+def score_overlay(score: int, total: int, size: Tuple[int, int]) -> Image.Image:
+    """Transparent layer with the star rating and score line for one result"""
+    width, height = size
+    overlay = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+
+    total = max(total, 1)
+    radius = min(width // (total * 3), 60)
+    spacing = radius * 2.6
+    start_x = width / 2 - spacing * (total - 1) / 2
+    cy = height * 0.72
+    for i in range(total):
+        points = _star_points(start_x + i * spacing, cy, radius)
+        if i < score:
+            draw.polygon(points, fill=GOLD)
+        else:
+            draw.polygon(points, outline=GOLD, width=3)
+
+    font = load_font(max(24, width // 20))
+    _draw_centered(draw, f"{score} / {total} scenes remembered", cy + radius * 2.2, width, font, CREAM)
+    tagline = load_font(max(18, width // 28))
+    _draw_centered(draw, _tagline(score, total), height * 0.85, width, tagline, GOLD)
+    return overlay
+
+
+def render_poster(score: int, total: int, title: str, size: Optional[Tuple[int, int]] = None) -> bytes:
+    """Compose the cached layers with the title and return JPEG bytes"""
+    size = size or POSTER_LOCAL_SIZE
+    poster = base_layer(size).copy()
+    poster.alpha_composite(score_overlay(score, total, size))
+
+    width, height = size
+    draw = ImageDraw.Draw(poster)
+    _draw_centered(draw, "LOVEREEL PRESENTS", height * 0.12, width, load_font(max(16, width // 30)), GOLD)
+    title_font = load_font(max(28, width // 11))
+    y = height * 0.2
+    for line in _wrap(title or "Untitled Love Story", title_font, width * 0.8)[:4]:
+        y = _draw_centered(draw, line, y, width, title_font, CREAM) + width // 60
+
+    buffer = BytesIO()
+    poster.convert("RGB").save(buffer, format="JPEG", quality=POSTER_LOCAL_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def poster_name(score: int, total: int, title: str, size: Optional[Tuple[int, int]] = None) -> str:
+    """Stable, collision-free file name for a rendered poster"""
+    key = f"{score}|{total}|{size or POSTER_LOCAL_SIZE}|{title}"
+    return "local_" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def _tagline(score: int, total: int) -> str:
+    ratio = score / max(total, 1)
+    if ratio == 1:
+        return "A flawless romance"
+    if ratio >= 0.6:
+        return "Critics are swooning"
+    if ratio > 0:
+        return "A charming work in progress"
+    return "The blooper reel is legendary"
+
+
+def _wrap(text: str, font: ImageFont.ImageFont, max_width: float) -> list:
+    lines, current = [], ""
+    for word in text.split():
+        candidate = f"{current} {word}".strip()
+        if current and font.getlength(candidate) > max_width:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _draw_centered(draw: ImageDraw.ImageDraw, text: str, y: float, width: int, font, fill) -> float:
+    """Draw one centered line and return the y coordinate of its bottom edge"""
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    draw.text(((width - (right - left)) / 2 - left, y), text, font=font, fill=fill)
+    return y + (bottom - top)
+
+
+def _star_points(cx: float, cy: float, radius: float) -> list:
+    points = []
+    for i in range(10):
+        r = radius if i % 2 == 0 else radius * 0.45
+        angle = math.pi / 2 + i * math.pi / 5
+        points.append((cx + r * math.cos(angle), cy - r * math.sin(angle)))
+    return points
+
+
+def _draw_heart(draw: ImageDraw.ImageDraw, cx: float, cy: float, size: float, fill) -> None:
+    r = size / 2
+    draw.ellipse((cx - size, cy - r, cx, cy + r), fill=fill)
+    draw.ellipse((cx, cy - r, cx + size, cy + r), fill=fill)
+    draw.polygon([(cx - size, cy + r * 0.2), (cx + size, cy + r * 0.2), (cx, cy + size * 1.3)], fill=fill)